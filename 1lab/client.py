@@ -11,6 +11,7 @@ HEADER_SIZE = 8
 
 COMMAND_HELP = {
     "get tasks": "Display running processes on server",
+    "get tasks json": "Same list as JSON records",
     "terminate [ID]": "Stop process by ID",
     "clear": "Clear terminal",
     "disconnect": "Close connection"
@@ -57,6 +58,11 @@ def process_command(client_sock):
         send_data(client_sock, user_input.encode(ENCODING))
         send_data(client_sock, b'')
         return 'receive'
+
+    elif user_input == 'get tasks json':
+        send_data(client_sock, user_input.encode(ENCODING))
+        send_data(client_sock, b'')
+        return 'receive json'
     
     elif user_input.startswith('terminate '):
         send_data(client_sock, user_input.encode(ENCODING))
@@ -78,8 +84,9 @@ def run_client():
             if status == 'invalid':
                 continue
                 
-            if status == 'receive':
-                output_file = f"process_list_{current_timestamp()}.txt"
+            if status in ('receive', 'receive json'):
+                extension = 'json' if status == 'receive json' else 'txt'
+                output_file = f"process_list_{current_timestamp()}.{extension}"
                 with open(output_file, 'w') as f:
                     while True:
                         data = receive_data(connection)
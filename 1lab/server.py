@@ -3,17 +3,43 @@ import os
 import time
 import json
 import struct
+import argparse
+import selectors
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from queue import SimpleQueue
+from typing import NamedTuple
+
+try:
+    import pwd
+except ImportError:
+    pwd = None
 
 LISTEN_PORT = 9090
 ENCODING = 'utf-8'
 HEADER_LENGTH = 8
 LOG_FILE = 'server_activities.log'
+MAX_CONNECTIONS = 512
+IDLE_TIMEOUT = 300
+COMMAND_WORKERS = 4
+RECV_SIZE = 65536
+# Commands are short, a bigger frame means a broken or hostile client
+MAX_FRAME = 1 << 16
+# Stop reading from a client while this much output waits for it
+OUTPUT_LIMIT = 1 << 22
+# Seconds one process list serves every request
+SNAPSHOT_TTL = 1.0
+PROC_DIR = '/proc'
+TASK_FORMATS = {'get tasks': 'text', 'get tasks json': 'json'}
 
 def get_timestamp():
     return time.strftime("%Y-%m-%d %H:%M:%S", time.localtime())
 
 def get_data(sock):
     header = sock.recv(HEADER_LENGTH, socket.MSG_WAITALL)
+    if len(header) < HEADER_LENGTH:
+        raise ConnectionError("Client disconnected")
     length = struct.unpack('!Q', header)[0]
     return b'' if length == 0 else sock.recv(length, socket.MSG_WAITALL)
 
@@ -34,6 +60,147 @@ def log_activity(message):
 def get_process_list():
     return os.popen("tasklist" if os.name == 'nt' else "ps -aux").read()
 
+class Process(NamedTuple):
+    pid: int
+    ppid: int
+    user: str
+    state: str
+    cpu_percent: float
+    mem_percent: float
+    vsz_kb: int
+    rss_kb: int
+    tty: str
+    started: float
+    cpu_time: float
+    command: str
+
+def tty_name(tty_nr):
+    major = (tty_nr >> 8) & 0xfff
+    minor = (tty_nr & 0xff) | ((tty_nr >> 12) & 0xfff00)
+    if 136 <= major <= 143:
+        return f"pts/{(major - 136) * 256 + minor}"
+    if major == 4:
+        return f"tty{minor}" if minor < 64 else f"ttyS{minor - 64}"
+    return '?'
+
+def proc_value(path, key):
+    # "key value ..." line of /proc/stat or /proc/meminfo
+    with open(path) as f:
+        for line in f:
+            if line.startswith(key):
+                return int(line.split()[1])
+    return 0
+
+def scan_processes():
+    """Reads every process from /proc, without spawning ps."""
+    ticks = os.sysconf('SC_CLK_TCK')
+    page_kb = os.sysconf('SC_PAGE_SIZE') // 1024
+    boot_time = proc_value(f'{PROC_DIR}/stat', 'btime')
+    mem_total = proc_value(f'{PROC_DIR}/meminfo', 'MemTotal:') or 1
+    now = time.time()
+    users = {}
+    processes = []
+    for entry in os.listdir(PROC_DIR):
+        if not entry.isdigit():
+            continue
+        path = f'{PROC_DIR}/{entry}'
+        try:
+            with open(f'{path}/stat', 'rb') as f:
+                stat = f.read().decode(ENCODING, errors='replace')
+            with open(f'{path}/cmdline', 'rb') as f:
+                cmdline = f.read()
+            uid = os.stat(path).st_uid
+        except OSError:
+            # The process exited during the scan
+            continue
+
+        # The command name may itself contain spaces and parentheses
+        comm = stat[stat.index('(') + 1:stat.rindex(')')]
+        fields = stat[stat.rindex(')') + 2:].split()
+        cpu_time = (int(fields[11]) + int(fields[12])) / ticks
+        started = boot_time + int(fields[19]) / ticks
+        rss_kb = int(fields[21]) * page_kb
+        if uid not in users:
+            try:
+                users[uid] = pwd.getpwuid(uid).pw_name if pwd else str(uid)
+            except KeyError:
+                users[uid] = str(uid)
+        command = cmdline.replace(b'\0', b' ').decode(ENCODING, errors='replace').strip()
+        processes.append(Process(
+            pid=int(entry),
+            ppid=int(fields[1]),
+            user=users[uid],
+            state=fields[0],
+            cpu_percent=round(100 * cpu_time / max(now - started, 1e-6), 1),
+            mem_percent=round(100 * rss_kb / mem_total, 1),
+            vsz_kb=int(fields[20]) // 1024,
+            rss_kb=rss_kb,
+            tty=tty_name(int(fields[4])),
+            started=started,
+            cpu_time=cpu_time,
+            command=command or f"[{comm}]"
+        ))
+    processes.sort(key=lambda process: process.pid)
+    return processes
+
+def render_text(processes, taken_at):
+    # Same columns as ps aux
+    lines = [f"{'USER':<10} {'PID':>6} {'%CPU':>4} {'%MEM':>4} {'VSZ':>6} {'RSS':>5} {'TTY':<8} {'STAT':<4} "
+             f"{'START':>5} {'TIME':>6} COMMAND"]
+    today = time.strftime("%Y-%m-%d", time.localtime(taken_at))
+    for p in processes:
+        started = time.localtime(p.started)
+        start = time.strftime("%H:%M" if time.strftime("%Y-%m-%d", started) == today else "%b%d", started)
+        cpu_time = f"{int(p.cpu_time // 60)}:{int(p.cpu_time % 60):02d}"
+        lines.append(f"{p.user[:10]:<10} {p.pid:>6} {p.cpu_percent:>4.1f} {p.mem_percent:>4.1f} {p.vsz_kb:>6} "
+                     f"{p.rss_kb:>5} {p.tty:<8} {p.state:<4} {start:>5} {cpu_time:>6} {p.command}")
+    return '\n'.join(lines) + '\n'
+
+def render_json(processes, taken_at):
+    return json.dumps({'timestamp': taken_at, 'processes': [p._asdict() for p in processes]},
+                      separators=(',', ':'))
+
+RENDERERS = {'text': render_text, 'json': render_json}
+
+class ProcessSnapshot:
+    """Process list shared by every request.
+
+    One scan of /proc serves all requests for `ttl` seconds; requests that
+    arrive during a scan wait for it instead of starting their own. Each
+    format is rendered once per scan. Without /proc the text format falls
+    back to ps or tasklist.
+    """
+
+    def __init__(self, ttl=SNAPSHOT_TTL):
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.taken_at = None
+        self.refreshed = 0.0
+        self.processes = []
+        self.rendered = {}
+
+    def get(self, fmt='text'):
+        if not os.path.isdir(PROC_DIR):
+            if fmt == 'json':
+                return json.dumps({'error': 'Structured process list needs /proc'}).encode(ENCODING)
+            return get_process_list().encode(ENCODING)
+
+        with self.lock:
+            if self.taken_at is None or time.monotonic() - self.refreshed >= self.ttl:
+                self.processes = scan_processes()
+                self.taken_at = time.time()
+                self.refreshed = time.monotonic()
+                self.rendered = {}
+            if fmt not in self.rendered:
+                self.rendered[fmt] = RENDERERS[fmt](self.processes, self.taken_at).encode(ENCODING)
+            return self.rendered[fmt]
+
+    def invalidate(self):
+        with self.lock:
+            self.taken_at = None
+
+snapshot = ProcessSnapshot()
+
 def terminate_process(process_id):
     try:
         if os.name == 'nt':
@@ -44,31 +211,38 @@ def terminate_process(process_id):
     except:
         return False
 
+def run_command(command):
+    # Response frames of one command, the task list ends with an empty frame
+    if command in TASK_FORMATS:
+        log_activity("Processing task list request")
+        return [snapshot.get(TASK_FORMATS[command]), b'']
+
+    if command.startswith('terminate '):
+        pid = command.split()[1]
+        log_activity(f"Attempting to terminate process {pid}")
+        if terminate_process(pid):
+            snapshot.invalidate()
+            log_activity(f"Successfully terminated process {pid}")
+        else:
+            log_activity(f"Failed to terminate process {pid}")
+        return []
+
+    log_activity(f"Unknown command: {command}")
+    return []
+
 def handle_connection(client_sock, client_addr):
     log_activity(f"New connection from {client_addr}")
     
     try:
         while True:
             request = get_data(client_sock)
+            # Empty frames only terminate commands
             if not request:
                 continue
-                
-            command = request.decode(ENCODING)
-            
-            if command == 'get tasks':
-                log_activity("Processing task list request")
-                processes = get_process_list()
-                send_data(client_sock, processes.encode(ENCODING))
-                send_data(client_sock, b'')
-                
-            elif command.startswith('terminate '):
-                pid = command.split()[1]
-                log_activity(f"Attempting to terminate process {pid}")
-                if terminate_process(pid):
-                    log_activity(f"Successfully terminated process {pid}")
-                else:
-                    log_activity(f"Failed to terminate process {pid}")
-                    
+
+            for frame in run_command(request.decode(ENCODING)):
+                send_data(client_sock, frame)
+
     except Exception as e:
         log_activity(f"Error: {str(e)}")
     finally:
@@ -77,6 +251,7 @@ def handle_connection(client_sock, client_addr):
 
 def start_server():
     server_sock = socket.socket()
+    server_sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
     server_sock.bind(('', LISTEN_PORT))
     server_sock.listen(1)
     log_activity("Server started and listening for connections")
@@ -90,11 +265,220 @@ def start_server():
     finally:
         server_sock.close()
 
-a = 3
-<<<<<<< HEAD
-=======
-b = 2324
->>>>>>> master
+class Connection:
+    """State of one client of the event server.
+
+    Frames are cut from whatever recv returns, commands run one at a time in
+    arrival order and their responses wait in the output buffer until the
+    socket accepts them.
+    """
+
+    def __init__(self, sock, addr):
+        self.sock = sock
+        self.addr = addr
+        self.inbuf = bytearray()
+        self.outbuf = bytearray()
+        # Body length once the header of a frame is in
+        self.expected = None
+        self.commands = deque()
+        self.busy = False
+        self.last_active = time.monotonic()
+
+    def frames(self):
+        while True:
+            if self.expected is None:
+                if len(self.inbuf) < HEADER_LENGTH:
+                    return
+                self.expected = struct.unpack('!Q', self.inbuf[:HEADER_LENGTH])[0]
+                del self.inbuf[:HEADER_LENGTH]
+                if self.expected > MAX_FRAME:
+                    raise ValueError(f"Frame of {self.expected} bytes is too long")
+            if len(self.inbuf) < self.expected:
+                return
+            frame = bytes(self.inbuf[:self.expected])
+            del self.inbuf[:self.expected]
+            self.expected = None
+            yield frame
+
+    def queue(self, message):
+        self.outbuf += struct.pack('!Q', len(message)) + message
+
+class EventServer:
+    """Serves many clients from one thread with a selector.
+
+    Commands block (listing or killing processes), so they run in a small
+    thread pool; finished ones are handed back through a socket pair that
+    wakes the selector up.
+    """
+
+    def __init__(self, port=LISTEN_PORT, max_connections=MAX_CONNECTIONS, idle_timeout=IDLE_TIMEOUT,
+                 workers=COMMAND_WORKERS):
+        self.port = port
+        self.max_connections = max_connections
+        self.idle_timeout = idle_timeout
+        self.selector = selectors.DefaultSelector()
+        self.pool = ThreadPoolExecutor(workers)
+        self.connections = {}
+        self.finished = SimpleQueue()
+        self.wakeup_reader, self.wakeup_writer = socket.socketpair()
+        self.listener = None
+        self.last_sweep = time.monotonic()
+
+    def serve_forever(self):
+        self.listener = socket.socket()
+        self.listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.listener.bind(('', self.port))
+        self.listener.listen(socket.SOMAXCONN)
+        self.listener.setblocking(False)
+        self.wakeup_reader.setblocking(False)
+        self.wakeup_writer.setblocking(False)
+        self.selector.register(self.listener, selectors.EVENT_READ)
+        self.selector.register(self.wakeup_reader, selectors.EVENT_READ)
+        log_activity(f"Event server started, up to {self.max_connections} connections")
+
+        try:
+            while True:
+                for key, mask in self.selector.select(timeout=1.0):
+                    if key.fileobj is self.listener:
+                        self.accept()
+                    elif key.fileobj is self.wakeup_reader:
+                        self.complete()
+                    else:
+                        if mask & selectors.EVENT_READ:
+                            self.read(key.data)
+                        if mask & selectors.EVENT_WRITE and key.data.sock in self.connections:
+                            self.write(key.data)
+                self.sweep()
+        except KeyboardInterrupt:
+            log_activity("Server shutdown by administrator")
+        finally:
+            for conn in list(self.connections.values()):
+                self.close(conn)
+            self.pool.shutdown(wait=False)
+            self.selector.close()
+            self.listener.close()
+            self.wakeup_reader.close()
+            self.wakeup_writer.close()
+
+    def accept(self):
+        while True:
+            try:
+                sock, addr = self.listener.accept()
+            except BlockingIOError:
+                return
+            if len(self.connections) >= self.max_connections:
+                log_activity(f"Refused connection from {addr}: {self.max_connections} clients connected")
+                sock.close()
+                continue
+            sock.setblocking(False)
+            conn = Connection(sock, addr)
+            self.connections[sock] = conn
+            self.selector.register(sock, selectors.EVENT_READ, conn)
+            log_activity(f"New connection from {addr}")
+
+    def read(self, conn):
+        try:
+            data = conn.sock.recv(RECV_SIZE)
+        except BlockingIOError:
+            return
+        except OSError as e:
+            log_activity(f"Error: {str(e)}")
+            data = b''
+        if not data:
+            self.close(conn)
+            return
+        conn.last_active = time.monotonic()
+        conn.inbuf += data
+        try:
+            # Empty frames only terminate commands
+            conn.commands.extend(frame.decode(ENCODING, errors='replace') for frame in conn.frames() if frame)
+        except ValueError as e:
+            log_activity(f"Error: {str(e)}")
+            self.close(conn)
+            return
+        self.dispatch(conn)
+
+    def dispatch(self, conn):
+        if conn.busy or not conn.commands:
+            return
+        conn.busy = True
+        future = self.pool.submit(run_command, conn.commands.popleft())
+        future.add_done_callback(lambda done: self.hand_back(conn, done))
+
+    def hand_back(self, conn, future):
+        # Runs in a pool thread
+        self.finished.put((conn, future))
+        try:
+            self.wakeup_writer.send(b'\0')
+        except BlockingIOError:
+            pass
+
+    def complete(self):
+        try:
+            while self.wakeup_reader.recv(RECV_SIZE):
+                pass
+        except BlockingIOError:
+            pass
+        while not self.finished.empty():
+            conn, future = self.finished.get()
+            conn.busy = False
+            if conn.sock not in self.connections:
+                continue
+            try:
+                frames = future.result()
+            except Exception as e:
+                log_activity(f"Error: {str(e)}")
+                frames = []
+            for frame in frames:
+                conn.queue(frame)
+            self.update(conn)
+            self.dispatch(conn)
+
+    def write(self, conn):
+        try:
+            sent = conn.sock.send(conn.outbuf)
+        except BlockingIOError:
+            return
+        except OSError as e:
+            log_activity(f"Error: {str(e)}")
+            self.close(conn)
+            return
+        del conn.outbuf[:sent]
+        conn.last_active = time.monotonic()
+        self.update(conn)
+
+    def update(self, conn):
+        events = selectors.EVENT_WRITE if conn.outbuf else 0
+        if len(conn.outbuf) < OUTPUT_LIMIT:
+            events |= selectors.EVENT_READ
+        self.selector.modify(conn.sock, events, conn)
+
+    def sweep(self):
+        now = time.monotonic()
+        if now - self.last_sweep < 1.0:
+            return
+        self.last_sweep = now
+        for conn in list(self.connections.values()):
+            if not conn.busy and now - conn.last_active > self.idle_timeout:
+                log_activity(f"Connection with {conn.addr} idle for {self.idle_timeout}s")
+                self.close(conn)
+
+    def close(self, conn):
+        self.connections.pop(conn.sock, None)
+        self.selector.unregister(conn.sock)
+        conn.sock.close()
+        log_activity(f"Closed connection with {conn.addr}")
 
 if __name__ == "__main__":
-    start_server()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Process monitor server")
+    parser.add_argument('--blocking', action='store_true', help='Serve one client at a time')
+    parser.add_argument('--max-connections', type=int, default=MAX_CONNECTIONS)
+    parser.add_argument('--idle-timeout', type=float, default=IDLE_TIMEOUT, help='Seconds before closing a silent client')
+    parser.add_argument('--snapshot-ttl', type=float, default=SNAPSHOT_TTL,
+                        help='Seconds one process list is reused, 0 scans for every request')
+    args = parser.parse_args()
+    snapshot.ttl = args.snapshot_ttl
+    if args.blocking:
+        start_server()
+    else:
+        EventServer(max_connections=args.max_connections, idle_timeout=args.idle_timeout).serve_forever()
@@ -1,4 +1,6 @@
 from celery import Celery
+from kombu import Queue
+from typing import Any, Dict
 from app.core.config import settings
 
 # Configure Celery with Redis
@@ -11,14 +13,42 @@ celery_app = Celery(
 )
 
 celery_app.conf.update(
-    task_serializer='json',
-    accept_content=['json'],
-    result_serializer='json',
+    # msgpack carries payloads as raw bytes instead of escaped base64 text
+    task_serializer=settings.CELERY_SERIALIZER,
+    accept_content=[settings.CELERY_SERIALIZER],
+    result_serializer=settings.CELERY_SERIALIZER,
+    result_expires=settings.RESULT_EXPIRES,
     timezone='UTC',
     enable_utc=True,
     broker_connection_retry=True,
     broker_connection_retry_on_startup=True,
     broker_connection_max_retries=10,
     task_track_started=True,
-    worker_concurrency=1
-) 
\ No newline at end of file
+    worker_concurrency=settings.SMALL_QUEUE_CONCURRENCY,
+    worker_prefetch_multiplier=settings.SMALL_QUEUE_PREFETCH,
+    # Small requests and large ones wait in separate queues, so a huge
+    # payload never sits in front of short jobs
+    task_queues=[Queue(settings.SMALL_QUEUE), Queue(settings.LARGE_QUEUE), Queue(settings.BLOCK_QUEUE)],
+    task_default_queue=settings.SMALL_QUEUE,
+    # Blocks of a fanned out payload belong to a large request, but get a queue
+    # of their own: the large queue runs one request at a time per worker
+    task_routes={
+        f'app.celery.tasks.{name}': {'queue': settings.BLOCK_QUEUE, 'priority': settings.LARGE_TASK_PRIORITY}
+        for name in ('encode_block', 'decode_block', 'join_encoded_blocks', 'join_decoded_blocks')
+    },
+    # On Redis every queue is split into priority lists, 0 is served first
+    broker_transport_options={
+        'priority_steps': list(range(10)),
+        'queue_order_strategy': 'priority',
+    },
+    task_default_priority=settings.SMALL_TASK_PRIORITY
+)
+
+def queue_options(operation: str, size: int) -> Dict[str, Any]:
+    # Queue and priority for a request, by operation first and payload size otherwise
+    large = size >= settings.LARGE_PAYLOAD_THRESHOLD
+    queue = settings.OPERATION_QUEUES.get(operation) or (settings.LARGE_QUEUE if large else settings.SMALL_QUEUE)
+    return {
+        'queue': queue,
+        'priority': settings.LARGE_TASK_PRIORITY if queue == settings.LARGE_QUEUE else settings.SMALL_TASK_PRIORITY
+    }
@@ -0,0 +1,56 @@
+import json
+import time
+from typing import Any, Dict, Optional
+
+import redis
+from celery.signals import task_failure, task_prerun, task_success
+
+from .celery_app import REDIS_URL
+from app.core.config import settings
+
+_client: Optional[redis.Redis] = None
+
+
+def get_client() -> redis.Redis:
+    global _client
+    if _client is None:
+        _client = redis.Redis.from_url(REDIS_URL, socket_connect_timeout=1, socket_timeout=1)
+    return _client
+
+
+def publish_event(task_id: str, state: str, meta: Optional[Dict[str, Any]] = None):
+    # Fire and forget: the API falls back to the result backend for lost events
+    event: Dict[str, Any] = {**(meta or {}), 'task_id': task_id, 'state': state}
+    try:
+        get_client().publish(settings.EVENTS_CHANNEL, json.dumps(event))
+    except redis.RedisError:
+        pass
+
+
+def timings(task) -> Dict[str, Any]:
+    # The API stamps `enqueued_at` into the message headers when sending a task
+    started_at = getattr(task.request, 'started_at', None)
+    enqueued_at = getattr(task.request, 'enqueued_at', None)
+    meta: Dict[str, Any] = {'task': task.name}
+    if started_at is not None:
+        meta['run_time'] = time.time() - started_at
+        if enqueued_at is not None:
+            meta['queue_wait'] = max(started_at - enqueued_at, 0.0)
+    return meta
+
+
+@task_prerun.connect
+def mark_started(task=None, **kwargs):
+    task.request.started_at = time.time()
+
+
+@task_success.connect
+def publish_success(sender=None, **kwargs):
+    # Sent once the result is stored, so the API can read it right away.
+    # A replaced task hands its id to the chord callback, which reports here.
+    publish_event(sender.request.id, 'SUCCESS', timings(sender))
+
+
+@task_failure.connect
+def publish_failure(sender=None, task_id=None, **kwargs):
+    publish_event(task_id, 'FAILURE', timings(sender))
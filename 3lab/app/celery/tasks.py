@@ -1,10 +1,37 @@
 from .celery_app import celery_app
-from celery import Task
-import time
+from celery import Task, chord
 import base64
+import io
 from collections import Counter
-import heapq
-from typing import Dict, Any
+from typing import Dict, Any, List, Optional, Union
+from app.services.huffman import ProgressCallback, build_byte_codes, huffman_encode, huffman_encode_bytes
+from app.services.container import FLAG_BYTES, container_flags, encode_container, decode_container
+from app.services.streaming import encode_bytes, decode_bytes, iter_blocks, iter_containers
+from app.services.progress import ProgressReporter
+from app.services.tables import (
+    code_cache, decoder_cache, cached_byte_decoder, cached_decoder, cached_tree_codes, get_static_table,
+    load_static_tables
+)
+from app.core.config import settings
+from .events import publish_event
+
+code_cache.maxsize = decoder_cache.maxsize = settings.CODE_CACHE_SIZE
+if settings.STATIC_TABLES_DIR:
+    load_static_tables(settings.STATIC_TABLES_DIR)
+
+# Serializers able to carry raw bytes in task arguments and results
+BINARY_SERIALIZERS = ('msgpack', 'pickle')
+
+def to_wire(payload: bytes) -> Union[bytes, str]:
+    # Raw bytes when the serializer allows it, base64 text otherwise
+    if celery_app.conf.task_serializer in BINARY_SERIALIZERS and celery_app.conf.result_serializer in BINARY_SERIALIZERS:
+        return payload
+    return base64.b64encode(payload).decode('utf-8')
+
+def from_wire(payload: Union[bytes, str]) -> bytes:
+    if isinstance(payload, (bytes, bytearray)):
+        return bytes(payload)
+    return base64.b64decode(payload)
 
 class WebSocketTask(Task):
     _websocket_connections = {}
@@ -13,122 +40,191 @@ class WebSocketTask(Task):
     def websocket_connections(self):
         return self._websocket_connections
 
-    def update_state(self, task_id=None, state=None, meta=None):
-        super().update_state(task_id=task_id, state=state, meta=meta)
-        # WebSocket connection handling will be implemented in the WebSocket manager
+    def update_state(self, task_id=None, state=None, meta=None, **kwargs):
+        super().update_state(task_id=task_id, state=state, meta=meta, **kwargs)
+        # The API process relays state changes to the client socket
+        publish_event(task_id or self.request.id, state, meta)
 
-class HuffmanNode:
-    def __init__(self, char, freq):
-        self.char = char
-        self.freq = freq
-        self.left = None
-        self.right = None
+    def progress_reporter(self, operation: str, total: int) -> ProgressReporter:
+        # Publishes real progress of the codec, throttled by time and by step
+        def publish(progress: int):
+            self.update_state(
+                state='PROGRESS',
+                meta={
+                    'status': 'PROGRESS',
+                    'task_id': self.request.id,
+                    'operation': operation,
+                    'progress': progress
+                }
+            )
 
-    def __lt__(self, other):
-        return self.freq < other.freq
+        return ProgressReporter(total, publish, settings.PROGRESS_MIN_INTERVAL, settings.PROGRESS_MIN_DELTA)
 
-def build_huffman_tree(data: str) -> Dict[str, str]:
-    # Count frequency of each character
-    frequency = Counter(data)
-    
-    # Create a priority queue to store nodes
-    heap = []
-    for char, freq in frequency.items():
-        heapq.heappush(heap, HuffmanNode(char, freq))
-    
-    # Build Huffman tree
-    while len(heap) > 1:
-        left = heapq.heappop(heap)
-        right = heapq.heappop(heap)
-        internal = HuffmanNode(None, left.freq + right.freq)
-        internal.left = left
-        internal.right = right
-        heapq.heappush(heap, internal)
-    
-    # Generate Huffman codes
-    codes = {}
-    def generate_codes(node, code=""):
-        if node.char is not None:
-            codes[node.char] = code
-            return
-        generate_codes(node.left, code + "0")
-        generate_codes(node.right, code + "1")
-    
-    if heap:
-        generate_codes(heap[0])
-    return codes
+def encode_text(data: str, output_format: str = 'json', table: Optional[str] = None,
+                progress: Optional[ProgressCallback] = None) -> Dict[str, Any]:
+    # A named static table replaces building one from the data
+    static_codes = get_static_table(table) if table else None
+
+    if output_format == 'container':
+        # Canonical codes packed together with the payload
+        container = encode_container(data, static_codes, progress)
+        return {
+            'encoded_data': to_wire(container),
+            'format': 'container'
+        }
+
+    if output_format == 'stream':
+        # Independent containers per block keep peak memory bounded by the block size
+        stream = encode_bytes(data, settings.STREAM_BLOCK_SIZE, static_codes, progress)
+        return {
+            'encoded_data': to_wire(stream),
+            'format': 'stream'
+        }
 
-@celery_app.task(bind=True, base=WebSocketTask)
-def encode_data(self, data: str) -> Dict[str, Any]:
-    # Simulate progress
-    total_steps = 5
-    for step in range(total_steps):
-        progress = (step + 1) * 20
-        self.update_state(
-            state='PROGRESS',
-            meta={
-                'status': 'PROGRESS',
-                'task_id': self.request.id,
-                'operation': 'encode',
-                'progress': progress
-            }
-        )
-        time.sleep(1)  # Simulate work
-    
     # Generate Huffman codes
-    huffman_codes = build_huffman_tree(data)
-    
-    # Encode data using Huffman codes
-    encoded = ''.join(huffman_codes[char] for char in data)
-    
-    # Pad encoded data to make it divisible by 8
-    padding = (8 - len(encoded) % 8) % 8
-    encoded += '0' * padding
+    huffman_codes = static_codes or cached_tree_codes(Counter(data))
     
-    # Convert binary string to bytes and then to base64
-    encoded_bytes = int(encoded, 2).to_bytes((len(encoded) + 7) // 8, byteorder='big')
-    base64_encoded = base64.b64encode(encoded_bytes).decode('utf-8')
+    # Pack Huffman codes directly into bytes
+    encoded_bytes, padding = huffman_encode(data, huffman_codes, progress)
+    wire_encoded = to_wire(encoded_bytes)
     
+    if table:
+        # The client refers to the table by name instead of shipping it
+        return {
+            'encoded_data': wire_encoded,
+            'table': table,
+            'padding': padding
+        }
+
+    return {
+        'encoded_data': wire_encoded,
+        'huffman_codes': huffman_codes,
+        'padding': padding
+    }
+
+def check_text_container(container: bytes):
+    # Byte mode containers decode to bytes, which a text result cannot carry
+    if container_flags(container) & FLAG_BYTES:
+        raise ValueError("Data was encoded from bytes, decode it with decode_bytes")
+
+def decode_text(encoded_data: Union[bytes, str], huffman_codes: Optional[Dict[str, str]] = None,
+                padding: Optional[int] = None, table: Optional[str] = None,
+                progress: Optional[ProgressCallback] = None) -> str:
+    encoded_bytes = from_wire(encoded_data)
+    if table:
+        huffman_codes = get_static_table(table)
+    if huffman_codes is None:
+        # The code tables travel inside the containers
+        check_text_container(encoded_bytes)
+        return decode_bytes(encoded_bytes, progress)
+    return cached_decoder(huffman_codes).decode(encoded_bytes, padding, progress)
+
+def encode_raw(data: Union[bytes, str], output_format: str = 'json',
+               progress: Optional[ProgressCallback] = None) -> Dict[str, Any]:
+    data = from_wire(data)
+
+    if output_format == 'container':
+        return {
+            'encoded_data': to_wire(encode_container(data, None, progress)),
+            'format': 'container'
+        }
+
+    if output_format == 'stream':
+        return {
+            'encoded_data': to_wire(encode_bytes(data, settings.STREAM_BLOCK_SIZE, None, progress)),
+            'format': 'stream'
+        }
+
+    # Codes are a 256-entry list indexed by byte value, null for absent bytes
+    huffman_codes = build_byte_codes(data)
+    encoded_bytes, padding = huffman_encode_bytes(data, huffman_codes, progress)
     return {
-        'encoded_data': base64_encoded,
+        'encoded_data': to_wire(encoded_bytes),
         'huffman_codes': huffman_codes,
         'padding': padding
     }
 
+def decode_raw(encoded_data: Union[bytes, str], huffman_codes: Optional[List[Optional[str]]] = None,
+               padding: Optional[int] = None, progress: Optional[ProgressCallback] = None) -> Union[bytes, str]:
+    encoded_bytes = from_wire(encoded_data)
+    if huffman_codes is None:
+        return to_wire(decode_bytes(encoded_bytes, progress))
+    return to_wire(cached_byte_decoder(huffman_codes).decode(encoded_bytes, padding, progress))
+
 @celery_app.task(bind=True, base=WebSocketTask)
-def decode_data(self, encoded_data: str, huffman_codes: Dict[str, str], padding: int) -> str:
-    # Simulate progress
-    total_steps = 5
-    for step in range(total_steps):
-        progress = (step + 1) * 20
-        self.update_state(
-            state='PROGRESS',
-            meta={
-                'status': 'PROGRESS',
-                'task_id': self.request.id,
-                'operation': 'decode',
-                'progress': progress
-            }
-        )
-        time.sleep(1)  # Simulate work
-    
-    # Decode base64 to bytes and then to binary string
-    encoded_bytes = base64.b64decode(encoded_data)
-    binary = bin(int.from_bytes(encoded_bytes, byteorder='big'))[2:]
-    
-    # Remove padding
-    binary = binary[:-padding] if padding else binary
-    
-    # Create reverse mapping of Huffman codes
-    reverse_codes = {code: char for char, code in huffman_codes.items()}
-    
-    # Decode using Huffman codes
-    decoded = ''
-    current_code = ''
-    for bit in binary:
-        current_code += bit
-        if current_code in reverse_codes:
-            decoded += reverse_codes[current_code]
-            current_code = ''
-    
-    return decoded 
\ No newline at end of file
+def encode_data(self, data: str, output_format: str = 'json', table: Optional[str] = None) -> Dict[str, Any]:
+    if output_format == 'stream' and len(data) >= settings.PARALLEL_THRESHOLD:
+        # Fan the blocks out to the workers and stitch them back in order
+        blocks = iter_blocks([data], settings.STREAM_BLOCK_SIZE)
+        return self.replace(chord([encode_block.s(block, table) for block in blocks], join_encoded_blocks.s()))
+    return encode_text(data, output_format, table, self.progress_reporter('encode', len(data)))
+
+@celery_app.task(bind=True, base=WebSocketTask)
+def decode_data(self, encoded_data: Union[bytes, str], huffman_codes: Optional[Dict[str, str]] = None, padding: Optional[int] = None,
+                table: Optional[str] = None) -> str:
+    encoded_bytes = from_wire(encoded_data)
+    if huffman_codes is None and table is None:
+        check_text_container(encoded_bytes)
+        # A container holds at most a block of symbols, so their number
+        # measures the stream in the unit of PARALLEL_THRESHOLD
+        containers = list(iter_containers(io.BytesIO(encoded_bytes)))
+        if len(containers) > 1 and len(containers) * settings.STREAM_BLOCK_SIZE >= settings.PARALLEL_THRESHOLD:
+            # Containers are independent, so each one can be decoded by its own task
+            return self.replace(chord(
+                [decode_block.s(to_wire(container)) for container in containers],
+                join_decoded_blocks.s()
+            ))
+    return decode_text(encoded_bytes, huffman_codes, padding, table, self.progress_reporter('decode', len(encoded_bytes)))
+
+@celery_app.task(bind=True, base=WebSocketTask)
+def encode_byte_data(self, data: Union[bytes, str], output_format: str = 'json') -> Dict[str, Any]:
+    data = from_wire(data)
+    return encode_raw(data, output_format, self.progress_reporter('encode_bytes', len(data)))
+
+@celery_app.task(bind=True, base=WebSocketTask)
+def decode_byte_data(self, encoded_data: Union[bytes, str], huffman_codes: Optional[List[Optional[str]]] = None,
+                     padding: Optional[int] = None) -> Union[bytes, str]:
+    encoded_bytes = from_wire(encoded_data)
+    return decode_raw(encoded_bytes, huffman_codes, padding, self.progress_reporter('decode_bytes', len(encoded_bytes)))
+
+@celery_app.task
+def encode_block(block: str, table: Optional[str] = None) -> Union[bytes, str]:
+    static_codes = get_static_table(table) if table else None
+    return to_wire(encode_container(block, static_codes))
+
+@celery_app.task
+def join_encoded_blocks(encoded_blocks: List[Union[bytes, str]]) -> Dict[str, Any]:
+    stream = b''.join(from_wire(block) for block in encoded_blocks)
+    return {
+        'encoded_data': to_wire(stream),
+        'format': 'stream'
+    }
+
+@celery_app.task
+def decode_block(container: Union[bytes, str]) -> str:
+    container = from_wire(container)
+    check_text_container(container)
+    return decode_container(container)
+
+@celery_app.task
+def join_decoded_blocks(decoded_blocks: List[str]) -> str:
+    return ''.join(decoded_blocks)
+
+# Plain functions behind each request task, with the same arguments and results
+PLAIN_FUNCTIONS = {
+    encode_data.name: encode_text,
+    decode_data.name: decode_text,
+    encode_byte_data.name: encode_raw,
+    decode_byte_data.name: decode_raw,
+}
+
+@celery_app.task
+def run_batch_chunk(items: List[List[Any]]) -> List[List[Any]]:
+    # Items are [index, task name, args]; a failed item does not fail the chunk
+    results = []
+    for index, name, args in items:
+        try:
+            results.append([index, None, PLAIN_FUNCTIONS[name](*args)])
+        except Exception as e:
+            results.append([index, str(e), None])
+    return results
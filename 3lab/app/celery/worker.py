@@ -0,0 +1,46 @@
+"""Starts a worker for one queue with its concurrency and prefetch from Settings.
+
+    python -m app.celery.worker small
+    python -m app.celery.worker large --pool=solo
+    python -m app.celery.worker blocks
+
+Extra arguments are passed to `celery worker` as they are.
+"""
+import sys
+from typing import List, Optional
+
+from app.core.config import settings
+from .celery_app import celery_app
+from . import tasks  # noqa: F401 - registers the tasks
+
+QUEUES = {
+    'small': (settings.SMALL_QUEUE, settings.SMALL_QUEUE_CONCURRENCY, settings.SMALL_QUEUE_PREFETCH,
+              settings.SMALL_QUEUE_AUTOSCALE),
+    'large': (settings.LARGE_QUEUE, settings.LARGE_QUEUE_CONCURRENCY, settings.LARGE_QUEUE_PREFETCH,
+              settings.LARGE_QUEUE_AUTOSCALE),
+    'blocks': (settings.BLOCK_QUEUE, settings.BLOCK_QUEUE_CONCURRENCY, settings.BLOCK_QUEUE_PREFETCH,
+               settings.BLOCK_QUEUE_AUTOSCALE),
+}
+
+
+def worker_args(name: str, extra: List[str]) -> List[str]:
+    queue, concurrency, prefetch, autoscale = QUEUES[name]
+    args = [
+        'worker', '-Q', queue, '-n', f'{name}@%h', '-l', 'info',
+        f'--concurrency={concurrency}', f'--prefetch-multiplier={prefetch}'
+    ]
+    if autoscale:
+        # "max,min" processes, grown and shrunk with the queue length
+        args.append(f'--autoscale={autoscale}')
+    return args + extra
+
+
+def main(argv: Optional[List[str]] = None):
+    argv = sys.argv[1:] if argv is None else argv
+    if not argv or argv[0] not in QUEUES:
+        sys.exit(f"Usage: python -m app.celery.worker {{{'|'.join(QUEUES)}}} [celery worker options]")
+    celery_app.worker_main(worker_args(argv[0], argv[1:]))
+
+
+if __name__ == '__main__':
+    main()
@@ -14,6 +14,48 @@ class Settings(BaseSettings):
     REDIS_HOST: str = "localhost"
     REDIS_PORT: int = 6380
     REDIS_DB: int = 0
+    CELERY_SERIALIZER: str = "json"
+    RESULT_EXPIRES: int = 3600
+    STREAM_BLOCK_SIZE: int = 1 << 20
+    PARALLEL_THRESHOLD: int = 4 << 20
+    CODE_CACHE_SIZE: int = 128
+    STATIC_TABLES_DIR: str = ""
+    PROGRESS_MIN_INTERVAL: float = 0.5
+    PROGRESS_MIN_DELTA: int = 5
+    TASK_TIMEOUT: int = 30
+    EVENTS_CHANNEL: str = "huffman:task-events"
+    EVENTS_POLL_INTERVAL: float = 5.0
+    PROGRESS_SEND_INTERVAL: float = 0.2
+    SESSION_MAX_TASKS: int = 256
+    SEND_QUEUE_SIZE: int = 64
+    SLOW_CONSUMER_LIMIT: int = 512
+    SEND_TIMEOUT: float = 10.0
+    FAST_PATH_THRESHOLD: int = 64 << 10
+    FAST_PATH_EXECUTOR: str = "thread"
+    FAST_PATH_WORKERS: int = 4
+    RESULT_CACHE_TTL: int = 3600
+    RESULT_CACHE_MAX_BYTES: int = 256 << 20
+    RESULT_CACHE_MAX_ENTRY: int = 16 << 20
+    SMALL_QUEUE: str = "codec.small"
+    LARGE_QUEUE: str = "codec.large"
+    LARGE_PAYLOAD_THRESHOLD: int = 1 << 20
+    OPERATION_QUEUES: Dict[str, str] = {}
+    SMALL_QUEUE_CONCURRENCY: int = 4
+    SMALL_QUEUE_PREFETCH: int = 4
+    SMALL_QUEUE_AUTOSCALE: str = ""
+    LARGE_QUEUE_CONCURRENCY: int = 1
+    LARGE_QUEUE_PREFETCH: int = 1
+    LARGE_QUEUE_AUTOSCALE: str = ""
+    # Blocks of fanned out payloads run side by side, one per core by default
+    BLOCK_QUEUE: str = "codec.blocks"
+    BLOCK_QUEUE_CONCURRENCY: int = os.cpu_count() or 1
+    BLOCK_QUEUE_PREFETCH: int = 1
+    BLOCK_QUEUE_AUTOSCALE: str = ""
+    SMALL_TASK_PRIORITY: int = 0
+    LARGE_TASK_PRIORITY: int = 6
+    BATCH_MAX_ITEMS: int = 10000
+    BATCH_CHUNK_SIZE: int = 16
+    BATCH_TIMEOUT: int = 300
 
 settings = Settings()
 
@@ -0,0 +1,147 @@
+import bisect
+from typing import Callable, Dict, Iterable, List, Sequence, Tuple, TypeVar, Union
+
+LabelValues = Tuple[str, ...]
+M = TypeVar('M', bound='Metric')
+
+# Bucket bounds shared by the pipeline metrics
+SECONDS_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+BYTES_BUCKETS = tuple(1 << shift for shift in range(6, 31, 2))
+RATIO_BUCKETS = (0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9, 1.0, 1.25, 1.5, 2.0)
+
+
+def format_labels(names: Sequence[str], values: Sequence[str], extra: str = '') -> str:
+    pairs = [f'{name}="{escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_value(value: float) -> str:
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class Metric:
+    kind = ''
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+
+    def label_values(self, labels: Dict[str, str]) -> LabelValues:
+        return tuple(str(labels.get(name, '')) for name in self.labelnames)
+
+    def header(self) -> List[str]:
+        return [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+
+    def samples(self) -> Iterable[str]:
+        return []
+
+    def render(self) -> List[str]:
+        return self.header() + list(self.samples())
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self.values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1, **labels: str):
+        key = self.label_values(labels)
+        self.values[key] = self.values.get(key, 0) + amount
+
+    def samples(self) -> Iterable[str]:
+        for key, value in sorted(self.values.items()):
+            yield f'{self.name}{format_labels(self.labelnames, key)} {format_value(value)}'
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, buckets: Sequence[float], labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Per label set: counts per bucket (not cumulative), sum, count
+        self.values: Dict[LabelValues, Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, **labels: str):
+        key = self.label_values(labels)
+        if key not in self.values:
+            self.values[key] = ([0] * (len(self.buckets) + 1), [0.0, 0])
+        counts, totals = self.values[key]
+        counts[bisect.bisect_left(self.buckets, value)] += 1
+        totals[0] += value
+        totals[1] += 1
+
+    def samples(self) -> Iterable[str]:
+        for key, (counts, totals) in sorted(self.values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                le = 'le="%s"' % ('+Inf' if bound == float('inf') else format_value(bound))
+                yield f'{self.name}_bucket{format_labels(self.labelnames, key, le)} {cumulative}'
+            yield f'{self.name}_sum{format_labels(self.labelnames, key)} {format_value(totals[0])}'
+            yield f'{self.name}_count{format_labels(self.labelnames, key)} {totals[1]}'
+
+
+class Gauge(Metric):
+    """Value read from a callback at scrape time, a number or {label value: number}."""
+    kind = 'gauge'
+
+    def __init__(self, name: str, documentation: str, read: Callable[[], Union[float, Dict[str, float]]],
+                 labelname: str = ''):
+        super().__init__(name, documentation, (labelname,) if labelname else ())
+        self.read = read
+
+    def samples(self) -> Iterable[str]:
+        value = self.read()
+        if isinstance(value, dict):
+            for label, number in sorted(value.items()):
+                yield f'{self.name}{format_labels(self.labelnames, (label,))} {format_value(number)}'
+        else:
+            yield f'{self.name} {format_value(value)}'
+
+
+class Registry:
+    def __init__(self):
+        self.metrics: List[Metric] = []
+
+    def register(self, metric: M) -> M:
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        # Prometheus text exposition format 0.0.4
+        lines: List[str] = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+queue_wait = registry.register(Histogram(
+    'huffman_task_queue_wait_seconds', 'Time a Celery task waited in the broker before a worker started it',
+    SECONDS_BUCKETS, ('task',)))
+task_run = registry.register(Histogram(
+    'huffman_task_run_seconds', 'Time a worker spent running a Celery task', SECONDS_BUCKETS, ('task',)))
+request_latency = registry.register(Histogram(
+    'huffman_request_seconds', 'Time from receiving a request to queueing its final message',
+    SECONDS_BUCKETS, ('operation', 'path')))
+send_delay = registry.register(Histogram(
+    'huffman_send_delay_seconds', 'Time a message waited in a connection send queue', SECONDS_BUCKETS))
+bytes_in = registry.register(Histogram(
+    'huffman_request_bytes_in', 'Payload size of requests', BYTES_BUCKETS, ('operation',)))
+bytes_out = registry.register(Histogram(
+    'huffman_request_bytes_out', 'Payload size of results', BYTES_BUCKETS, ('operation',)))
+compression_ratio = registry.register(Histogram(
+    'huffman_compression_ratio', 'Encoded size divided by input size', RATIO_BUCKETS, ('operation',)))
+requests_total = registry.register(Counter(
+    'huffman_requests_total', 'Requests by operation and outcome', ('operation', 'status')))
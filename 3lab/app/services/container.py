@@ -0,0 +1,141 @@
+import struct
+import zlib
+from collections import Counter
+from typing import BinaryIO, Dict, Optional, Tuple, Union
+
+from app.services.huffman import (
+    ByteCodes,
+    ProgressCallback,
+    build_codes_from_frequency,
+    byte_codes_list,
+    byte_frequency,
+    canonical_codes,
+    huffman_encode,
+    huffman_encode_bytes,
+    make_canonical,
+)
+from app.services.tables import cached_byte_decoder, cached_codes, cached_decoder
+
+# Binary container layout (all integers are big-endian):
+#   magic (4s) | version (B) | flags (B) | padding (B) | symbol count (I)
+#   symbol count x [code point or byte value (3 bytes) | code length (B)]
+#   payload length (Q) | payload | CRC32 of everything above (I)
+MAGIC = b'HUFC'
+VERSION = 1
+
+HEADER = struct.Struct('>4sBBBI')
+LENGTH_ENTRY = struct.Struct('>3sB')
+PAYLOAD_LENGTH = struct.Struct('>Q')
+CHECKSUM = struct.Struct('>I')
+
+# The payload holds raw bytes rather than text
+FLAG_BYTES = 0x01
+
+
+class ContainerError(ValueError):
+    pass
+
+
+def build_canonical_codes(data: str) -> Dict[str, str]:
+    return cached_codes(Counter(data))
+
+
+def build_canonical_codes_from_frequency(frequency: Dict[str, int]) -> Dict[str, str]:
+    return make_canonical(build_codes_from_frequency(frequency))
+
+
+def pack_container(huffman_codes: Dict[str, str], payload: bytes, padding: int, flags: int = 0) -> bytes:
+    parts = [HEADER.pack(MAGIC, VERSION, flags, padding, len(huffman_codes))]
+    for char, code in sorted(huffman_codes.items(), key=lambda item: (len(item[1]), item[0])):
+        symbol = char if isinstance(char, int) else ord(char)
+        parts.append(LENGTH_ENTRY.pack(symbol.to_bytes(3, byteorder='big'), len(code)))
+    parts.append(PAYLOAD_LENGTH.pack(len(payload)))
+    parts.append(payload)
+    body = b''.join(parts)
+    return body + CHECKSUM.pack(zlib.crc32(body))
+
+
+def unpack_container(blob: bytes) -> Tuple[Dict[Union[str, int], str], bytes, int, int]:
+    if len(blob) < HEADER.size + PAYLOAD_LENGTH.size + CHECKSUM.size:
+        raise ContainerError("Container is truncated")
+    magic, version, flags, padding, symbol_count = HEADER.unpack_from(blob, 0)
+    if magic != MAGIC:
+        raise ContainerError("Not a Huffman container")
+    if version != VERSION:
+        raise ContainerError(f"Unsupported container version {version}")
+
+    (checksum,) = CHECKSUM.unpack_from(blob, len(blob) - CHECKSUM.size)
+    if zlib.crc32(memoryview(blob)[:-CHECKSUM.size]) != checksum:
+        raise ContainerError("Container checksum mismatch")
+
+    offset = HEADER.size
+    code_lengths = {}
+    for _ in range(symbol_count):
+        code_point, length = LENGTH_ENTRY.unpack_from(blob, offset)
+        symbol = int.from_bytes(code_point, byteorder='big')
+        code_lengths[symbol if flags & FLAG_BYTES else chr(symbol)] = length
+        offset += LENGTH_ENTRY.size
+
+    (payload_length,) = PAYLOAD_LENGTH.unpack_from(blob, offset)
+    offset += PAYLOAD_LENGTH.size
+    if offset + payload_length + CHECKSUM.size != len(blob):
+        raise ContainerError("Container payload length mismatch")
+    payload = bytes(blob[offset:offset + payload_length])
+    return canonical_codes(code_lengths), payload, padding, flags
+
+
+def container_flags(blob: bytes) -> int:
+    # Flags of the first container in a blob, without decoding anything
+    if len(blob) < HEADER.size:
+        raise ContainerError("Container is truncated")
+    magic, version, flags, _, _ = HEADER.unpack_from(blob, 0)
+    if magic != MAGIC:
+        raise ContainerError("Not a Huffman container")
+    return flags
+
+
+def read_container(stream: BinaryIO) -> Optional[bytes]:
+    # Reads exactly one container from a binary stream, None at the end of it
+    header = stream.read(HEADER.size)
+    if not header:
+        return None
+    if len(header) < HEADER.size:
+        raise ContainerError("Container is truncated")
+    symbol_count = HEADER.unpack(header)[4]
+    table = stream.read(symbol_count * LENGTH_ENTRY.size + PAYLOAD_LENGTH.size)
+    if len(table) < symbol_count * LENGTH_ENTRY.size + PAYLOAD_LENGTH.size:
+        raise ContainerError("Container is truncated")
+    (payload_length,) = PAYLOAD_LENGTH.unpack_from(table, len(table) - PAYLOAD_LENGTH.size)
+    rest = stream.read(payload_length + CHECKSUM.size)
+    if len(rest) < payload_length + CHECKSUM.size:
+        raise ContainerError("Container is truncated")
+    return header + table + rest
+
+
+def encode_container(data: Union[str, bytes], huffman_codes: Optional[Union[Dict[str, str], ByteCodes]] = None,
+                     progress: Optional[ProgressCallback] = None) -> bytes:
+    if isinstance(data, (bytes, bytearray)):
+        return encode_byte_container(data, huffman_codes, progress)
+
+    # Externally supplied codes must be canonical to survive the length table
+    huffman_codes = make_canonical(huffman_codes) if huffman_codes else build_canonical_codes(data)
+    payload, padding = huffman_encode(data, huffman_codes, progress)
+    return pack_container(huffman_codes, payload, padding)
+
+
+def encode_byte_container(data: bytes, huffman_codes: Optional[ByteCodes] = None,
+                          progress: Optional[ProgressCallback] = None) -> bytes:
+    if huffman_codes:
+        huffman_codes = make_canonical({value: code for value, code in enumerate(huffman_codes) if code})
+    else:
+        frequency = {value: freq for value, freq in enumerate(byte_frequency(data)) if freq}
+        huffman_codes = cached_codes(frequency)
+    payload, padding = huffman_encode_bytes(data, byte_codes_list(huffman_codes), progress)
+    return pack_container(huffman_codes, payload, padding, FLAG_BYTES)
+
+
+def decode_container(blob: bytes, progress: Optional[ProgressCallback] = None) -> Union[str, bytes]:
+    huffman_codes, payload, padding, flags = unpack_container(blob)
+    if flags & FLAG_BYTES:
+        return cached_byte_decoder(byte_codes_list(huffman_codes)).decode(payload, padding, progress)
+    return cached_decoder(huffman_codes).decode(payload, padding, progress)
@@ -0,0 +1,331 @@
+from collections import Counter
+import heapq
+from typing import Callable, Dict, List, Optional, Sequence, Tuple, Union
+
+# Number of bits resolved by a single lookup in the decoding table
+DEFAULT_LOOKUP_BITS = 12
+# Bytes pulled into the bit accumulator per refill
+REFILL_BYTES = 64
+# Symbols translated into a bit string at once by the encoder
+ENCODE_CHUNK_SIZE = 1 << 16
+# Walking the code tree over this many payload bits costs about as much as
+# building one entry of the decoding table
+TABLE_ENTRY_COST = 16
+# Payload bytes decoded between two progress callbacks
+DECODE_PROGRESS_STEP = 1 << 16
+
+# Called with the number of symbols (encoder) or payload bytes (decoder) processed so far
+ProgressCallback = Callable[[int], None]
+# Byte mode keeps codes in a list indexed by byte value, None for absent bytes
+ByteCodes = List[Optional[str]]
+
+
+class HuffmanNode:
+    def __init__(self, char, freq):
+        self.char = char
+        self.freq = freq
+        self.left = None
+        self.right = None
+
+    def __lt__(self, other):
+        return self.freq < other.freq
+
+def build_huffman_tree(data: str) -> Dict[str, str]:
+    # Count frequency of each character
+    return build_codes_from_frequency(Counter(data))
+
+def build_codes_from_frequency(frequency: Dict[str, int]) -> Dict[str, str]:
+    # Create a priority queue to store nodes
+    heap = []
+    for char, freq in frequency.items():
+        heapq.heappush(heap, HuffmanNode(char, freq))
+    
+    # Build Huffman tree
+    while len(heap) > 1:
+        left = heapq.heappop(heap)
+        right = heapq.heappop(heap)
+        internal = HuffmanNode(None, left.freq + right.freq)
+        internal.left = left
+        internal.right = right
+        heapq.heappush(heap, internal)
+    
+    # Generate Huffman codes
+    codes = {}
+    def generate_codes(node, code=""):
+        if node.char is not None:
+            # A single-symbol alphabet still needs one bit per symbol
+            codes[node.char] = code or "0"
+            return
+        generate_codes(node.left, code + "0")
+        generate_codes(node.right, code + "1")
+    
+    if heap:
+        generate_codes(heap[0])
+    return codes
+
+
+def byte_frequency(data: bytes) -> List[int]:
+    # Counter has a C fast path for iterables, the result goes into a 256-slot array
+    frequency = [0] * 256
+    for value, freq in Counter(data).items():
+        frequency[value] = freq
+    return frequency
+
+
+def build_byte_codes(data: bytes) -> ByteCodes:
+    return byte_codes_from_frequency(byte_frequency(data))
+
+
+def byte_codes_from_frequency(frequency: Sequence[int]) -> ByteCodes:
+    codes = build_codes_from_frequency({value: freq for value, freq in enumerate(frequency) if freq})
+    return byte_codes_list(codes)
+
+
+def byte_codes_list(huffman_codes: Dict[int, str]) -> ByteCodes:
+    codes = [None] * 256
+    for value, code in huffman_codes.items():
+        codes[value] = code
+    return codes
+
+
+def canonical_codes(code_lengths: Dict[str, int]) -> Dict[str, str]:
+    # Symbols are ordered by (code length, symbol) and receive consecutive codes,
+    # so the lengths alone are enough to rebuild the table
+    codes = {}
+    code = 0
+    previous_length = 0
+    for char, length in sorted(code_lengths.items(), key=lambda item: (item[1], item[0])):
+        code <<= length - previous_length
+        codes[char] = format(code, f'0{length}b')
+        code += 1
+        previous_length = length
+    return codes
+
+
+def make_canonical(huffman_codes: Dict[str, str]) -> Dict[str, str]:
+    return canonical_codes({char: len(code) for char, code in huffman_codes.items()})
+
+
+class HuffmanEncoder:
+    """Packs Huffman codes straight into bytes.
+
+    The input is processed in chunks of `chunk_size` symbols: each chunk is
+    mapped to its bit string and converted to bytes with a single `int`
+    conversion, so only one chunk worth of '0'/'1' characters is alive at a time.
+    Bits that do not fill a whole byte are carried over to the next chunk.
+
+    Text is encoded with a dict of codes per character, bytes with a 256-entry
+    list indexed directly by byte value.
+    """
+
+    def __init__(self, huffman_codes: Union[Dict[str, str], ByteCodes], chunk_size: int = ENCODE_CHUNK_SIZE):
+        self.huffman_codes = huffman_codes
+        self.chunk_size = chunk_size
+
+    def encode(self, data: Union[str, bytes], progress: Optional[ProgressCallback] = None) -> Tuple[bytes, int]:
+        encoded = bytearray()
+        carry = ''
+        for start in range(0, len(data), self.chunk_size):
+            try:
+                bits = carry + ''.join(map(self.huffman_codes.__getitem__, data[start:start + self.chunk_size]))
+            except KeyError as e:
+                raise ValueError(f"Symbol {e.args[0]!r} has no Huffman code")
+            except TypeError:
+                raise ValueError("Data contains a byte that has no Huffman code")
+            whole = len(bits) - len(bits) % 8
+            if whole:
+                encoded += int(bits[:whole], 2).to_bytes(whole // 8, byteorder='big')
+            carry = bits[whole:]
+            if progress:
+                progress(min(start + self.chunk_size, len(data)))
+
+        # Pad the last byte with zeros
+        padding = (8 - len(carry) % 8) % 8
+        if carry:
+            encoded += int(carry + '0' * padding, 2).to_bytes(1, byteorder='big')
+        return bytes(encoded), padding
+
+
+class HuffmanDecoder:
+    """Table-driven Huffman decoder.
+
+    Instead of walking the payload bit by bit, the decoder looks up
+    `lookup_bits` bits at once in a precomputed table that yields every
+    symbol completely contained in that window. Codes longer than the
+    window and the tail of the stream fall back to a walk over the code tree.
+
+    The window is never wider than the longest code, and the table is only
+    built for the first payload long enough to pay for it (TABLE_ENTRY_COST
+    bits per entry); shorter payloads are decoded with the tree walk alone.
+    """
+
+    # Joins decoded pieces, the byte mode decoder produces bytes instead
+    _empty = ''
+
+    def __init__(self, huffman_codes: Dict[str, str], lookup_bits: int = DEFAULT_LOOKUP_BITS):
+        self.huffman_codes = huffman_codes
+        self.max_code_length = max((len(code) for code in huffman_codes.values()), default=0)
+        self.lookup_bits = max(1, min(lookup_bits, self.max_code_length))
+        self._children: List[List[int]] = [[-1, -1]]
+        self._symbols: List[str] = [None]
+        self._build_tree()
+        self._table: Optional[List[Tuple[str, int]]] = None
+
+    def _build_tree(self):
+        for char, code in self.huffman_codes.items():
+            if not code:
+                continue
+            node = 0
+            for bit in code:
+                bit = 1 if bit == '1' else 0
+                if self._children[node][bit] < 0:
+                    self._children.append([-1, -1])
+                    self._symbols.append(None)
+                    self._children[node][bit] = len(self._children) - 1
+                node = self._children[node][bit]
+            self._symbols[node] = self._piece(char)
+
+    def _piece(self, symbol):
+        return symbol
+
+    def _build_table(self) -> List[Tuple[str, int]]:
+        # Each entry holds the symbols fully decoded from the window and the
+        # number of bits they occupy. A zero bit count means the next code does
+        # not fit in the window (or is invalid) and the tree walk must be used.
+        bits = self.lookup_bits
+        children, symbols = self._children, self._symbols
+        table = []
+        for window in range(1 << bits):
+            emitted = []
+            consumed = 0
+            node = 0
+            for i in range(bits - 1, -1, -1):
+                node = children[node][(window >> i) & 1]
+                if node < 0:
+                    break
+                if symbols[node] is not None:
+                    emitted.append(symbols[node])
+                    consumed = bits - i
+                    node = 0
+            table.append((self._empty.join(emitted), consumed))
+        return table
+
+    def _walk(self, payload: bytes, padding: int) -> str:
+        # Bit by bit over the code tree, for payloads too short to pay for the table
+        children, symbols = self._children, self._symbols
+        nbits = len(payload) * 8 - padding
+        if nbits <= 0:
+            return self._empty
+        bits = format(int.from_bytes(payload, byteorder='big') >> padding, f'0{nbits}b')
+        decoded = []
+        node = 0
+        for bit in bits:
+            node = children[node][bit == '1']
+            if node < 0:
+                break
+            if symbols[node] is not None:
+                decoded.append(symbols[node])
+                node = 0
+        return self._empty.join(decoded)
+
+    def decode(self, payload: bytes, padding: int = 0, progress: Optional[ProgressCallback] = None) -> str:
+        bits = self.lookup_bits
+        size = len(payload)
+        if self._table is None and size * 8 - padding < (1 << bits) * TABLE_ENTRY_COST:
+            decoded = self._walk(payload, padding)
+            if progress:
+                progress(size)
+            return decoded
+
+        if self._table is None:
+            self._table = self._build_table()
+        mask = (1 << bits) - 1
+        need = max(bits, self.max_code_length)
+        table, children, symbols = self._table, self._children, self._symbols
+
+        decoded = []
+        append = decoded.append
+        acc = 0
+        nbits = 0
+        pos = 0
+        next_report = DECODE_PROGRESS_STEP
+        while True:
+            if pos < size:
+                if progress and pos >= next_report:
+                    progress(pos)
+                    next_report += DECODE_PROGRESS_STEP
+                chunk = payload[pos:pos + REFILL_BYTES]
+                pos += len(chunk)
+                acc = ((acc & ((1 << nbits) - 1)) << (len(chunk) * 8)) | int.from_bytes(chunk, byteorder='big')
+                nbits += len(chunk) * 8
+                if pos >= size and padding:
+                    # Drop the padding once the last byte has been loaded
+                    acc >>= padding
+                    nbits -= padding
+
+            # Fast path: keep at least `need` bits buffered so that any valid
+            # code can be resolved without refilling in the middle of it
+            limit = need if pos < size else bits
+            while nbits >= limit:
+                chunk_symbols, consumed = table[(acc >> (nbits - bits)) & mask]
+                if not consumed:
+                    break
+                append(chunk_symbols)
+                nbits -= consumed
+            if pos < size and nbits < need:
+                continue
+
+            # Slow path: decode a single symbol walking the tree
+            node = 0
+            i = nbits
+            symbol = None
+            while i > 0:
+                i -= 1
+                node = children[node][(acc >> i) & 1]
+                if node < 0:
+                    break
+                symbol = symbols[node]
+                if symbol is not None:
+                    break
+            if symbol is None:
+                break
+            append(symbol)
+            nbits = i
+
+        if progress:
+            progress(size)
+        return self._empty.join(decoded)
+
+
+class ByteHuffmanDecoder(HuffmanDecoder):
+    """Table-driven decoder for byte mode, producing bytes."""
+
+    _empty = b''
+
+    def __init__(self, huffman_codes: Union[Dict[int, str], ByteCodes], lookup_bits: int = DEFAULT_LOOKUP_BITS):
+        if not isinstance(huffman_codes, dict):
+            huffman_codes = {value: code for value, code in enumerate(huffman_codes) if code}
+        super().__init__(huffman_codes, lookup_bits)
+
+    def _piece(self, symbol):
+        return bytes((symbol,))
+
+
+def huffman_decode(encoded_bytes: bytes, huffman_codes: Dict[str, str], padding: int,
+                   progress: Optional[ProgressCallback] = None) -> str:
+    return HuffmanDecoder(huffman_codes).decode(encoded_bytes, padding, progress)
+
+
+def huffman_encode(data: str, huffman_codes: Dict[str, str],
+                   progress: Optional[ProgressCallback] = None) -> Tuple[bytes, int]:
+    return HuffmanEncoder(huffman_codes).encode(data, progress)
+
+
+def huffman_encode_bytes(data: bytes, huffman_codes: ByteCodes,
+                         progress: Optional[ProgressCallback] = None) -> Tuple[bytes, int]:
+    return HuffmanEncoder(huffman_codes).encode(data, progress)
+
+
+def huffman_decode_bytes(encoded_bytes: bytes, huffman_codes: ByteCodes, padding: int,
+                         progress: Optional[ProgressCallback] = None) -> bytes:
+    return ByteHuffmanDecoder(huffman_codes).decode(encoded_bytes, padding, progress)
@@ -0,0 +1,76 @@
+import io
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from typing import Callable, Dict, Iterable, Iterator, Optional
+
+from app.services.container import decode_container, encode_container
+from app.services.streaming import (
+    DEFAULT_BLOCK_SIZE,
+    file_codes,
+    iter_blocks,
+    iter_containers,
+    iter_text,
+    write_containers,
+    write_text,
+)
+
+# Payloads below this many symbols stay on the single-block path
+DEFAULT_PARALLEL_THRESHOLD = 4 << 20
+
+
+def ordered_map(func: Callable, items: Iterable, max_workers: Optional[int] = None) -> Iterator:
+    """Maps `func` over `items` in a process pool, yielding results in order.
+
+    At most two tasks per worker are in flight, so a lazy input is never
+    read far ahead of what has been consumed.
+    """
+    max_workers = max_workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        pending = deque()
+        for item in items:
+            pending.append(executor.submit(func, item))
+            if len(pending) >= max_workers * 2:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def parallel_encode_stream(chunks: Iterable[str], block_size: int = DEFAULT_BLOCK_SIZE,
+                           max_workers: Optional[int] = None,
+                           huffman_codes: Optional[Dict[str, str]] = None) -> Iterator[bytes]:
+    encode = partial(encode_container, huffman_codes=huffman_codes)
+    return ordered_map(encode, iter_blocks(chunks, block_size), max_workers)
+
+
+def parallel_decode_stream(containers: Iterable[bytes], max_workers: Optional[int] = None) -> Iterator[str]:
+    return ordered_map(decode_container, containers, max_workers)
+
+
+def parallel_encode_bytes(data: str, block_size: int = DEFAULT_BLOCK_SIZE, max_workers: Optional[int] = None,
+                          threshold: int = DEFAULT_PARALLEL_THRESHOLD) -> bytes:
+    if len(data) < threshold:
+        return encode_container(data)
+    return b''.join(parallel_encode_stream([data], block_size, max_workers))
+
+
+def parallel_decode_bytes(blob: bytes, max_workers: Optional[int] = None,
+                          threshold: int = DEFAULT_PARALLEL_THRESHOLD) -> str:
+    containers = iter_containers(io.BytesIO(blob))
+    if len(blob) < threshold:
+        return ''.join(decode_container(container) for container in containers)
+    return ''.join(parallel_decode_stream(containers, max_workers))
+
+
+def parallel_encode_file(src_path: str, dst_path: str, block_size: int = DEFAULT_BLOCK_SIZE,
+                         shared_table: bool = False, max_workers: Optional[int] = None) -> int:
+    huffman_codes = file_codes(src_path, block_size) if shared_table else None
+    with open(src_path, 'r', encoding='utf-8', newline='') as src:
+        containers = parallel_encode_stream(iter_text(src, block_size), block_size, max_workers, huffman_codes)
+        return write_containers(containers, dst_path)
+
+
+def parallel_decode_file(src_path: str, dst_path: str, max_workers: Optional[int] = None) -> int:
+    with open(src_path, 'rb') as src:
+        return write_text(parallel_decode_stream(iter_containers(src), max_workers), dst_path)
@@ -0,0 +1,41 @@
+import time
+from typing import Callable
+
+# Defaults for how often progress may be published
+DEFAULT_MIN_INTERVAL = 0.5
+DEFAULT_MIN_DELTA = 5
+
+
+class ProgressReporter:
+    """Turns processed units into percentages and publishes them sparingly.
+
+    A percentage is published only when at least `min_interval` seconds have
+    passed since the previous one and it grew by at least `min_delta` points,
+    so fast jobs publish nothing and slow ones do not flood the backend.
+    """
+
+    def __init__(self, total: int, publish: Callable[[int], None],
+                 min_interval: float = DEFAULT_MIN_INTERVAL, min_delta: int = DEFAULT_MIN_DELTA):
+        self.total = max(total, 1)
+        self.publish = publish
+        self.min_interval = min_interval
+        self.min_delta = min_delta
+        self.done = 0
+        self.last_progress = 0
+        self.last_time = time.monotonic()
+
+    def update(self, done: int):
+        self.done = min(done, self.total)
+        progress = self.done * 100 // self.total
+        now = time.monotonic()
+        if progress - self.last_progress < self.min_delta or now - self.last_time < self.min_interval:
+            return
+        self.last_progress = progress
+        self.last_time = now
+        self.publish(progress)
+
+    def advance(self, amount: int):
+        self.update(self.done + amount)
+
+    def __call__(self, done: int):
+        self.update(done)
@@ -0,0 +1,134 @@
+import io
+from collections import Counter
+from typing import AnyStr, BinaryIO, Dict, Iterable, Iterator, Optional, TextIO, Union
+
+from app.services.huffman import ProgressCallback
+from app.services.container import (
+    build_canonical_codes_from_frequency,
+    decode_container,
+    encode_container,
+    read_container,
+)
+
+# Symbols per independently encoded block
+DEFAULT_BLOCK_SIZE = 1 << 20
+
+
+def iter_blocks(chunks: Iterable[AnyStr], block_size: int = DEFAULT_BLOCK_SIZE) -> Iterator[AnyStr]:
+    # Re-slices arbitrary chunks of text or bytes into blocks of exactly block_size symbols
+    buffer = []
+    buffered = 0
+    empty = None
+    for chunk in chunks:
+        empty = chunk[:0]
+        while chunk:
+            piece = chunk[:block_size - buffered]
+            chunk = chunk[len(piece):]
+            buffer.append(piece)
+            buffered += len(piece)
+            if buffered == block_size:
+                yield empty.join(buffer)
+                buffer = []
+                buffered = 0
+    if buffered:
+        yield empty.join(buffer)
+
+
+def iter_text(source: TextIO, chunk_size: int = DEFAULT_BLOCK_SIZE) -> Iterator[str]:
+    while True:
+        chunk = source.read(chunk_size)
+        if not chunk:
+            return
+        yield chunk
+
+
+def iter_containers(source: BinaryIO) -> Iterator[bytes]:
+    while True:
+        container = read_container(source)
+        if container is None:
+            return
+        yield container
+
+
+def encode_stream(chunks: Iterable[AnyStr], block_size: int = DEFAULT_BLOCK_SIZE,
+                  huffman_codes: Optional[Dict[str, str]] = None,
+                  progress: Optional[ProgressCallback] = None) -> Iterator[bytes]:
+    """Encodes text into a sequence of containers, one per block.
+
+    Every block gets its own table unless `huffman_codes` is given, in which
+    case the shared table is used for all of them. Only one block is held in
+    memory at a time.
+    """
+    done = 0
+    for block in iter_blocks(chunks, block_size):
+        yield encode_container(block, huffman_codes, _offset(progress, done))
+        done += len(block)
+
+
+def decode_stream(containers: Iterable[bytes], progress: Optional[ProgressCallback] = None) -> Iterator[AnyStr]:
+    done = 0
+    for container in containers:
+        yield decode_container(container, _offset(progress, done))
+        done += len(container)
+
+
+def _offset(progress: Optional[ProgressCallback], done: int) -> Optional[ProgressCallback]:
+    # Reports progress inside a block relative to the whole stream
+    if progress is None:
+        return None
+    return lambda processed: progress(done + processed)
+
+
+def encode_bytes(data: AnyStr, block_size: int = DEFAULT_BLOCK_SIZE,
+                 huffman_codes: Optional[Dict[str, str]] = None,
+                 progress: Optional[ProgressCallback] = None) -> bytes:
+    return b''.join(encode_stream([data], block_size, huffman_codes, progress))
+
+
+def decode_bytes(blob: bytes, progress: Optional[ProgressCallback] = None) -> Union[str, bytes]:
+    # Text or bytes, depending on what the containers were encoded from
+    blocks = list(decode_stream(iter_containers(io.BytesIO(blob)), progress))
+    return blocks[0][:0].join(blocks) if blocks else ''
+
+
+def count_frequency(chunks: Iterable[str]) -> Dict[str, int]:
+    frequency = Counter()
+    for chunk in chunks:
+        frequency.update(chunk)
+    return frequency
+
+
+def write_containers(containers: Iterable[bytes], dst_path: str) -> int:
+    written = 0
+    with open(dst_path, 'wb') as dst:
+        for container in containers:
+            dst.write(container)
+            written += len(container)
+    return written
+
+
+def write_text(texts: Iterable[str], dst_path: str) -> int:
+    written = 0
+    with open(dst_path, 'w', encoding='utf-8', newline='') as dst:
+        for text in texts:
+            dst.write(text)
+            written += len(text)
+    return written
+
+
+def file_codes(src_path: str, block_size: int = DEFAULT_BLOCK_SIZE) -> Dict[str, str]:
+    # Counting pass for a table shared by every block of the file
+    with open(src_path, 'r', encoding='utf-8', newline='') as src:
+        return build_canonical_codes_from_frequency(count_frequency(iter_text(src, block_size)))
+
+
+def encode_file(src_path: str, dst_path: str, block_size: int = DEFAULT_BLOCK_SIZE,
+                shared_table: bool = False) -> int:
+    huffman_codes = file_codes(src_path, block_size) if shared_table else None
+    with open(src_path, 'r', encoding='utf-8', newline='') as src:
+        return write_containers(encode_stream(iter_text(src, block_size), block_size, huffman_codes), dst_path)
+
+
+def decode_file(src_path: str, dst_path: str) -> int:
+    with open(src_path, 'rb') as src:
+        return write_text(decode_stream(iter_containers(src)), dst_path)
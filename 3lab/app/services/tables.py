@@ -0,0 +1,188 @@
+import heapq
+import json
+import os
+import string
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Tuple
+
+from app.services.huffman import (
+    ByteCodes,
+    ByteHuffmanDecoder,
+    HuffmanDecoder,
+    build_codes_from_frequency,
+    make_canonical,
+)
+
+# Tables kept per cache before the least recently used one is evicted
+DEFAULT_CACHE_SIZE = 128
+# Histograms can be scaled to this total before being used as a cache key, so
+# near-identical distributions share one table. 0 keeps exact counts, which
+# always gives the optimal code.
+DEFAULT_RESOLUTION = 0
+# A table shared through a scaled histogram is used only while it codes the
+# exact histogram in at most this fraction more bits than the optimal code
+CODE_COST_TOLERANCE = 0.005
+
+
+class LRUCache:
+    """Least recently used cache, safe to share between threads.
+
+    The fast path codes requests on several threads at once; values are
+    built outside the lock, so a slow factory does not block other lookups.
+    """
+
+    def __init__(self, maxsize: int = DEFAULT_CACHE_SIZE):
+        self.maxsize = maxsize
+        self._items: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable, factory: Callable[[], Any]) -> Any:
+        with self._lock:
+            if key in self._items:
+                self.hits += 1
+                self._items.move_to_end(key)
+                return self._items[key]
+            self.misses += 1
+
+        value = factory()
+        with self._lock:
+            # Another thread may have built the same value meanwhile
+            if key in self._items:
+                self._items.move_to_end(key)
+                return self._items[key]
+            self._items[key] = value
+            if len(self._items) > self.maxsize:
+                self._items.popitem(last=False)
+                self.evictions += 1
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                'size': len(self._items),
+                'maxsize': self.maxsize,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions
+            }
+
+
+code_cache = LRUCache()
+decoder_cache = LRUCache()
+
+
+def quantize_histogram(frequency: Dict[str, int], resolution: int = DEFAULT_RESOLUTION) -> Tuple[Tuple[str, int], ...]:
+    if not resolution:
+        return tuple(sorted(frequency.items()))
+    total = sum(frequency.values()) or 1
+    # Every present symbol keeps a non-zero weight so it still gets a code
+    return tuple(sorted((char, max(1, round(freq * resolution / total))) for char, freq in frequency.items()))
+
+
+def code_cost(frequency: Dict[str, int], huffman_codes: Dict[str, str]) -> int:
+    # Size in bits of the payload coding this histogram
+    return sum(freq * len(huffman_codes[char]) for char, freq in frequency.items())
+
+
+def optimal_cost(frequency: Dict[str, int]) -> int:
+    # Size in bits under a Huffman code: the sum of the merged weights,
+    # found without building the tree itself
+    heap = list(frequency.values())
+    heapq.heapify(heap)
+    cost = 0
+    while len(heap) > 1:
+        merged = heapq.heappop(heap) + heapq.heappop(heap)
+        cost += merged
+        heapq.heappush(heap, merged)
+    return cost if len(frequency) > 1 else sum(frequency.values())
+
+
+def cached_codes(frequency: Dict[str, int], resolution: int = DEFAULT_RESOLUTION) -> Dict[str, str]:
+    """Canonical codes for a histogram, cached per exact histogram.
+
+    With a resolution, histograms with the same scaled shape share a table,
+    as long as it stays within CODE_COST_TOLERANCE of the optimal size.
+    """
+    if resolution:
+        key = quantize_histogram(frequency, resolution)
+        codes = code_cache.get(('canonical', resolution, key),
+                               lambda: make_canonical(build_codes_from_frequency(dict(key))))
+        if code_cost(frequency, codes) <= optimal_cost(frequency) * (1 + CODE_COST_TOLERANCE):
+            return codes
+    key = quantize_histogram(frequency, 0)
+    return code_cache.get(('canonical', key), lambda: make_canonical(build_codes_from_frequency(dict(key))))
+
+
+def cached_tree_codes(frequency: Dict[str, int]) -> Dict[str, str]:
+    """Codes exactly as `build_codes_from_frequency` assigns them, cached per exact histogram."""
+    key = tuple(frequency.items())
+    return code_cache.get(('tree', key), lambda: build_codes_from_frequency(frequency))
+
+
+def cached_decoder(huffman_codes: Dict[str, str]) -> HuffmanDecoder:
+    key = tuple(sorted(huffman_codes.items()))
+    return decoder_cache.get(key, lambda: HuffmanDecoder(dict(key)))
+
+
+def cached_byte_decoder(huffman_codes: ByteCodes) -> ByteHuffmanDecoder:
+    key = ('bytes', tuple(huffman_codes))
+    return decoder_cache.get(key, lambda: ByteHuffmanDecoder(list(huffman_codes)))
+
+
+def cache_stats() -> Dict[str, Dict[str, int]]:
+    return {
+        'codes': code_cache.stats(),
+        'decoders': decoder_cache.stats()
+    }
+
+
+def text_frequency() -> Dict[str, int]:
+    # Rough English letter frequencies (per mille) over printable ASCII
+    letters = dict(zip('etaoinshrdlcumwfgypbvkjxqz', [
+        127, 91, 82, 75, 70, 67, 63, 61, 60, 43, 40, 28, 28, 24, 24, 22,
+        20, 20, 19, 15, 10, 8, 2, 2, 1, 1
+    ]))
+    frequency = {char: 1 for char in string.printable}
+    for char, freq in letters.items():
+        frequency[char] = freq * 4
+        frequency[char.upper()] = max(1, freq // 4)
+    frequency[' '] = 700
+    frequency['\n'] = 60
+    frequency['.'] = frequency[','] = 30
+    return frequency
+
+
+static_tables: Dict[str, Dict[str, str]] = {
+    'text': make_canonical(build_codes_from_frequency(text_frequency()))
+}
+
+
+def register_static_table(name: str, huffman_codes: Dict[str, str]):
+    static_tables[name] = make_canonical(huffman_codes)
+
+
+def get_static_table(name: str) -> Dict[str, str]:
+    try:
+        return static_tables[name]
+    except KeyError:
+        raise ValueError(f"Unknown static table: {name}")
+
+
+def load_static_tables(directory: str):
+    # Every <name>.json file holds either a code table or a symbol histogram
+    for filename in sorted(os.listdir(directory)):
+        if not filename.endswith('.json'):
+            continue
+        with open(os.path.join(directory, filename), encoding='utf-8') as f:
+            table = json.load(f)
+        if all(isinstance(value, int) for value in table.values()):
+            table = build_codes_from_frequency(table)
+        register_static_table(filename[:-len('.json')], table)
@@ -0,0 +1,133 @@
+import asyncio
+import json
+from typing import Any, Callable, Dict, Optional, Tuple
+
+import redis.asyncio as aioredis
+from celery import states
+
+from app.celery.celery_app import REDIS_URL, celery_app
+from app.core import metrics
+from app.core.config import settings
+
+READY_STATES = ('SUCCESS', 'FAILURE')
+# Pause before resubscribing after the Redis connection dropped
+RECONNECT_DELAY = 1.0
+# Pause before reading the result again when the event came first
+STORE_RETRY_DELAY = 0.01
+
+
+ProgressHandler = Callable[[Dict[str, Any]], None]
+
+
+class TaskEvents:
+    """Waits for Celery tasks without blocking the event loop.
+
+    Workers publish a small event to a Redis channel when a task changes state;
+    a single listener per process hands progress events to the handler of the
+    task and resolves its future once the task finishes. The result itself is
+    then read from the result backend, where it is already stored. Events are
+    not persisted, so waiters also poll the backend every `poll_interval`
+    seconds to recover from missed ones.
+    """
+
+    def __init__(self, redis_url: str, channel: str, poll_interval: float):
+        self.redis_url = redis_url
+        self.channel = channel
+        self.poll_interval = poll_interval
+        self._waiters: Dict[str, Tuple[asyncio.Future, Optional[ProgressHandler]]] = {}
+        self._listener: Optional[asyncio.Task] = None
+
+    def watch(self, task_id: str, on_progress: Optional[ProgressHandler] = None) -> asyncio.Future:
+        # Register before sending the task, or a fast worker could finish unseen
+        future = asyncio.get_running_loop().create_future()
+        self._waiters[task_id] = (future, on_progress)
+        return future
+
+    def forget(self, task_id: str):
+        self._waiters.pop(task_id, None)
+
+    def dispatch(self, event: Dict[str, Any]):
+        waiter = self._waiters.get(event.get('task_id'))
+        if waiter is None:
+            return
+        future, on_progress = waiter
+        if future.done():
+            return
+        if event.get('state') in READY_STATES:
+            if 'queue_wait' in event:
+                metrics.queue_wait.observe(event['queue_wait'], task=event.get('task', ''))
+            if 'run_time' in event:
+                metrics.task_run.observe(event['run_time'], task=event.get('task', ''))
+            future.set_result(event)
+        elif event.get('state') == 'PROGRESS' and on_progress is not None:
+            on_progress(event)
+
+    async def wait(self, task_id: str, timeout: float) -> Any:
+        future = self._waiters[task_id][0] if task_id in self._waiters else self.watch(task_id)
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        try:
+            while True:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    raise TimeoutError(f"Task {task_id} timed out")
+                if future.done():
+                    # Stored before the event is sent, so this is only a safety net
+                    await asyncio.sleep(min(STORE_RETRY_DELAY, remaining))
+                else:
+                    try:
+                        await asyncio.wait_for(asyncio.shield(future), min(self.poll_interval, remaining))
+                    except asyncio.TimeoutError:
+                        pass
+                meta = await asyncio.to_thread(self.fetch, task_id)
+                if meta['status'] in states.READY_STATES:
+                    return self.outcome(meta)
+        finally:
+            self.forget(task_id)
+
+    @staticmethod
+    def fetch(task_id: str) -> Dict[str, Any]:
+        # A plain read of the stored meta; AsyncResult.get would subscribe on
+        # the backend's shared pubsub connection, which is not thread safe.
+        # The caller is the only reader, so a finished result goes right away.
+        backend = celery_app.backend
+        meta = backend.get_task_meta(task_id, cache=False)
+        if meta['status'] in states.READY_STATES:
+            backend.forget(task_id)
+        return meta
+
+    @staticmethod
+    def outcome(meta: Dict[str, Any]) -> Any:
+        if meta['status'] == states.SUCCESS:
+            return meta['result']
+        raise celery_app.backend.exception_to_python(meta['result'])
+
+    async def listen(self):
+        while True:
+            try:
+                client = aioredis.from_url(self.redis_url)
+                async with client.pubsub() as pubsub:
+                    await pubsub.subscribe(self.channel)
+                    async for message in pubsub.listen():
+                        if message['type'] == 'message':
+                            self.dispatch(json.loads(message['data']))
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                await asyncio.sleep(RECONNECT_DELAY)
+
+    def start(self):
+        if self._listener is None:
+            self._listener = asyncio.get_running_loop().create_task(self.listen())
+
+    async def stop(self):
+        if self._listener is not None:
+            self._listener.cancel()
+            try:
+                await self._listener
+            except asyncio.CancelledError:
+                pass
+            self._listener = None
+
+
+task_events = TaskEvents(REDIS_URL, settings.EVENTS_CHANNEL, settings.EVENTS_POLL_INTERVAL)
@@ -0,0 +1,38 @@
+import asyncio
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+from typing import Any, Optional
+
+from celery.canvas import Signature
+
+from app.celery.tasks import PLAIN_FUNCTIONS
+from app.core.config import settings
+
+_executor: Optional[Executor] = None
+
+
+def get_executor() -> Executor:
+    global _executor
+    if _executor is None:
+        if settings.FAST_PATH_EXECUTOR == 'process':
+            _executor = ProcessPoolExecutor(settings.FAST_PATH_WORKERS)
+        else:
+            _executor = ThreadPoolExecutor(settings.FAST_PATH_WORKERS, thread_name_prefix='fast-path')
+    return _executor
+
+
+def shutdown_executor():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+
+def runs_locally(task: Signature, size: int) -> bool:
+    # Small payloads cost less to code here than the broker round trip does
+    return size < settings.FAST_PATH_THRESHOLD and task.task in PLAIN_FUNCTIONS
+
+
+async def run_locally(task: Signature) -> Any:
+    func = partial(PLAIN_FUNCTIONS[task.task], *task.args, **task.kwargs)
+    return await asyncio.get_running_loop().run_in_executor(get_executor(), func)
@@ -1,20 +1,174 @@
 from fastapi import WebSocket
-from typing import Dict, List
+from typing import Any, Deque, Dict, List, Optional, Tuple, Union
+from collections import deque
+import asyncio
 import json
-from app.core.config import WebSocketMessage
+import time
+from app.core import metrics
+from app.core.config import WebSocketMessage, settings
+
+Frame = Union[Dict[str, Any], bytes]
+
+class Outgoing:
+    # Frames sent back to back, e.g. a COMPLETED message and its binary payload
+    __slots__ = ('frames', 'task_id', 'progress', 'cancelled', 'queued_at')
+
+    def __init__(self, frames: Tuple[Frame, ...], task_id: Optional[str], progress: bool):
+        self.frames = frames
+        self.task_id = task_id
+        self.progress = progress
+        self.cancelled = False
+        self.queued_at = time.monotonic()
+
+class Connection:
+    """Outbound side of one socket: a bounded queue drained by its own writer task.
+
+    Senders only enqueue, so a slow client never delays the code producing
+    events. Once `queue_size` entries are waiting, progress updates are
+    dropped to make room while final messages are always kept; a client that
+    lets `slow_limit` entries pile up, or stalls a single send for
+    `send_timeout` seconds, is disconnected.
+    """
+
+    def __init__(self, websocket: WebSocket, queue_size: int, slow_limit: int, send_timeout: float):
+        self.websocket = websocket
+        self.queue_size = queue_size
+        self.slow_limit = slow_limit
+        self.send_timeout = send_timeout
+        self.queue: Deque[Outgoing] = deque()
+        # Queued progress per task, replaced in place by newer updates
+        self.queued_progress: Dict[Optional[str], Outgoing] = {}
+        self.depth = 0
+        self.dropped = 0
+        self.closed = False
+        self.too_slow = False
+        self.ready = asyncio.Event()
+        self.idle = asyncio.Event()
+        self.idle.set()
+        self.writer = asyncio.get_running_loop().create_task(self.run())
+
+    def enqueue(self, frames: Tuple[Frame, ...], task_id: Optional[str] = None, progress: bool = False):
+        if self.closed:
+            return
+        if progress:
+            queued = self.queued_progress.get(task_id)
+            if queued is not None:
+                queued.frames = frames
+                return
+            if self.depth >= self.queue_size:
+                self.dropped += 1
+                return
+        else:
+            # A final message makes any queued progress of the task stale
+            self.cancel(self.queued_progress.get(task_id))
+            if self.depth >= self.queue_size and self.queued_progress:
+                self.cancel(next(iter(self.queued_progress.values())))
+                self.dropped += 1
+            if self.depth >= self.slow_limit:
+                self.too_slow = True
+                self.close()
+                return
+
+        entry = Outgoing(frames, task_id, progress)
+        if progress:
+            self.queued_progress[task_id] = entry
+        self.queue.append(entry)
+        self.depth += 1
+        self.idle.clear()
+        self.ready.set()
+
+    def cancel(self, entry: Optional[Outgoing]):
+        if entry is None or entry.cancelled:
+            return
+        entry.cancelled = True
+        self.depth -= 1
+        if entry.progress:
+            self.queued_progress.pop(entry.task_id, None)
+
+    async def run(self):
+        try:
+            while True:
+                while not self.queue:
+                    self.idle.set()
+                    self.ready.clear()
+                    await self.ready.wait()
+                entry = self.queue.popleft()
+                if entry.cancelled:
+                    continue
+                self.cancel(entry)
+                metrics.send_delay.observe(time.monotonic() - entry.queued_at)
+                for frame in entry.frames:
+                    if isinstance(frame, bytes):
+                        await asyncio.wait_for(self.websocket.send_bytes(frame), self.send_timeout)
+                    else:
+                        await asyncio.wait_for(self.websocket.send_json(frame), self.send_timeout)
+        except asyncio.TimeoutError:
+            self.too_slow = True
+            self.close()
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            # The client is gone
+            self.close()
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        self.queue.clear()
+        self.queued_progress.clear()
+        self.depth = 0
+        self.idle.set()
+        if self.writer is not asyncio.current_task():
+            self.writer.cancel()
+        if self.too_slow:
+            asyncio.get_running_loop().create_task(self._close_socket())
+
+    async def _close_socket(self):
+        try:
+            await self.websocket.close(code=1008)
+        except Exception:
+            pass
+
+    async def drain(self, timeout: float):
+        try:
+            await asyncio.wait_for(self.idle.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
 
 class ConnectionManager:
     def __init__(self):
-        # Store connections by user_id and task_id
+        # Store connections by user_id and task_id. A session socket is
+        # stored once for every task it carries.
         self.active_connections: Dict[str, Dict[str, WebSocket]] = {}
+        self.connections: Dict[WebSocket, Connection] = {}
+        # Latest unsent progress of every task on a socket, flushed together
+        # at a bounded rate per socket
+        self.pending_progress: Dict[WebSocket, Dict[Tuple[str, str], WebSocketMessage]] = {}
+        self.progress_flushers: Dict[WebSocket, asyncio.Task] = {}
+        self.last_progress_sent: Dict[WebSocket, float] = {}
+        # Totals of connections already released
+        self.dropped = 0
+        self.slow_disconnects = 0
 
-    async def connect(self, websocket: WebSocket, user_id: str, task_id: str):
+    async def accept(self, websocket: WebSocket):
         await websocket.accept()
+        self.connections[websocket] = Connection(
+            websocket, settings.SEND_QUEUE_SIZE, settings.SLOW_CONSUMER_LIMIT, settings.SEND_TIMEOUT)
+
+    async def connect(self, websocket: WebSocket, user_id: str, task_id: str):
+        await self.accept(websocket)
+        self.register(websocket, user_id, task_id)
+
+    def register(self, websocket: WebSocket, user_id: str, task_id: str):
+        # Routes messages of a task to an already accepted socket
         if user_id not in self.active_connections:
             self.active_connections[user_id] = {}
         self.active_connections[user_id][task_id] = websocket
 
     def disconnect(self, user_id: str, task_id: str):
+        # While the task still leads to its socket
+        self.drop_progress(user_id, task_id)
         try:
             if user_id in self.active_connections:
                 if task_id in self.active_connections[user_id]:
@@ -24,18 +178,130 @@ class ConnectionManager:
         except Exception:
             pass
 
+    async def release(self, websocket: WebSocket):
+        # Called once the endpoint is done with the socket, flushes what is queued
+        self.pending_progress.pop(websocket, None)
+        self.last_progress_sent.pop(websocket, None)
+        flusher = self.progress_flushers.pop(websocket, None)
+        if flusher is not None:
+            flusher.cancel()
+        connection = self.connections.pop(websocket, None)
+        if connection is None:
+            return
+        await connection.drain(settings.SEND_TIMEOUT)
+        connection.writer.cancel()
+        self.dropped += connection.dropped
+        self.slow_disconnects += connection.too_slow
+
+    async def send_json(self, data: Dict[str, Any], user_id: str, task_id: str):
+        self._send(user_id, task_id, (data,))
+
     async def send_message(self, message: WebSocketMessage, user_id: str, task_id: str):
-        try:
-            if self.get_connection(user_id, task_id):
-                websocket = self.active_connections[user_id][task_id]
-                await websocket.send_json(message.model_dump())
-        except Exception:
+        progress = message.status == "PROGRESS"
+        if not progress:
+            # A stale percentage must not arrive after the final message
+            self.drop_progress(user_id, task_id)
+        self._send(user_id, task_id, (message.model_dump(),), progress)
+
+    async def send_bytes(self, payload: bytes, user_id: str, task_id: str):
+        self._send(user_id, task_id, (payload,))
+
+    async def send_result(self, message: WebSocketMessage, payload: Optional[bytes], user_id: str, task_id: str):
+        self.drop_progress(user_id, task_id)
+        frames = (message.model_dump(),) if payload is None else (message.model_dump(), payload)
+        self._send(user_id, task_id, frames)
+
+    def _send(self, user_id: str, task_id: str, frames: Tuple[Frame, ...], progress: bool = False):
+        connection = self.connections.get(self.get_connection(user_id, task_id))
+        if connection is None:
+            return
+        connection.enqueue(frames, task_id, progress)
+        if connection.closed:
             self.disconnect(user_id, task_id)
 
+    async def send_frames(self, websocket: WebSocket, *frames: Frame):
+        connection = self.connections.get(websocket)
+        if connection is not None:
+            connection.enqueue(frames)
+
+    async def broadcast(self, message: WebSocketMessage, user_id: Optional[str] = None):
+        # Enqueuing never waits, the writers of all sockets then send concurrently
+        if user_id is None:
+            sockets = list(self.connections)
+        else:
+            sockets = list(set(self.active_connections.get(user_id, {}).values()))
+        frame = message.model_dump()
+        for websocket in sockets:
+            connection = self.connections.get(websocket)
+            if connection is not None:
+                connection.enqueue((frame,))
+
+    def stats(self) -> Dict[str, int]:
+        connections = list(self.connections.values())
+        depths = [connection.depth for connection in connections]
+        return {
+            'connections': len(connections),
+            'queued': sum(depths),
+            'max_queue_depth': max(depths, default=0),
+            'dropped': self.dropped + sum(connection.dropped for connection in connections),
+            'slow_disconnects': self.slow_disconnects + sum(connection.too_slow for connection in connections)
+        }
+
+    def push_progress(self, message: WebSocketMessage, user_id: str, task_id: str):
+        """Queue a progress update, replacing any of the task that has not been sent yet.
+
+        Updates of all tasks on a connection are flushed together, at most once
+        per PROGRESS_SEND_INTERVAL, and only the latest one of each task goes
+        out, so a session carrying many tasks is limited like a single task.
+        """
+        websocket = self.get_connection(user_id, task_id)
+        if websocket is None:
+            return
+        self.pending_progress.setdefault(websocket, {})[(user_id, task_id)] = message
+        if websocket not in self.progress_flushers:
+            delay = self.last_progress_sent.get(websocket, 0.0) + settings.PROGRESS_SEND_INTERVAL - time.monotonic()
+            self.progress_flushers[websocket] = asyncio.get_running_loop().create_task(
+                self._flush_progress(websocket, max(delay, 0.0)))
+
+    async def _flush_progress(self, websocket: WebSocket, delay: float):
+        try:
+            if delay:
+                await asyncio.sleep(delay)
+        finally:
+            if self.progress_flushers.get(websocket) is asyncio.current_task():
+                self.progress_flushers.pop(websocket)
+        pending = self.pending_progress.pop(websocket, None)
+        if pending:
+            self.last_progress_sent[websocket] = time.monotonic()
+            for (user_id, task_id), message in pending.items():
+                await self.send_message(message, user_id, task_id)
+
+    def drop_progress(self, user_id: str, task_id: str):
+        websocket = self.get_connection(user_id, task_id)
+        pending = self.pending_progress.get(websocket)
+        if pending is None:
+            return
+        pending.pop((user_id, task_id), None)
+        if not pending:
+            # Nothing left for the socket, its next update may go out on schedule
+            self.pending_progress.pop(websocket)
+            flusher = self.progress_flushers.pop(websocket, None)
+            if flusher is not None:
+                flusher.cancel()
+
     def get_connection(self, user_id: str, task_id: str) -> WebSocket:
         try:
             return self.active_connections.get(user_id, {}).get(task_id)
         except Exception:
             return None
 
-manager = ConnectionManager() 
\ No newline at end of file
+manager = ConnectionManager()
+
+for name, documentation, field in (
+    ('huffman_active_connections', 'Open WebSocket connections', 'connections'),
+    ('huffman_send_queue_depth', 'Messages waiting in all send queues', 'queued'),
+    ('huffman_send_queue_max_depth', 'Messages waiting in the longest send queue', 'max_queue_depth'),
+    ('huffman_send_dropped', 'Progress messages dropped for slow consumers', 'dropped'),
+    ('huffman_slow_disconnects', 'Connections closed for not keeping up', 'slow_disconnects'),
+):
+    metrics.registry.register(metrics.Gauge(name, documentation, lambda field=field: manager.stats()[field]))
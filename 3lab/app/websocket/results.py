@@ -0,0 +1,201 @@
+import asyncio
+import hashlib
+import json
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional, Set
+
+import redis.asyncio as aioredis
+from celery.canvas import Signature
+from kombu.exceptions import KombuError
+from kombu.serialization import dumps, loads, prepare_accept_content
+
+from app.celery.celery_app import REDIS_URL, celery_app
+from app.core.config import settings
+from app.services.tables import static_tables
+
+KEY_PREFIX = 'huffman:result:'
+# Cached keys scored by last use, and the stored size of each
+INDEX_KEY = 'huffman:results:index'
+SIZES_KEY = 'huffman:results:sizes'
+TOTAL_KEY = 'huffman:results:total'
+
+# The total only changes together with the sizes hash, so storing a key again
+# counts just the difference and a vanished key is subtracted exactly once
+STORE_SCRIPT = """
+local previous = tonumber(redis.call('HGET', KEYS[3], KEYS[1]) or '0')
+redis.call('HMSET', KEYS[1], 'content_type', ARGV[1], 'encoding', ARGV[2], 'body', ARGV[3])
+redis.call('EXPIRE', KEYS[1], ARGV[4])
+redis.call('ZADD', KEYS[2], ARGV[5], KEYS[1])
+redis.call('HSET', KEYS[3], KEYS[1], ARGV[6])
+return redis.call('INCRBY', KEYS[4], tonumber(ARGV[6]) - previous)
+"""
+FORGET_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 1 then
+    return 0
+end
+local size = tonumber(redis.call('HGET', KEYS[3], KEYS[1]) or '0')
+redis.call('HDEL', KEYS[3], KEYS[1])
+redis.call('ZREM', KEYS[2], KEYS[1])
+if size > 0 then
+    redis.call('DECRBY', KEYS[4], size)
+end
+return size
+"""
+EVICT_SCRIPT = """
+local keys = redis.call('ZRANGE', KEYS[1], 0, tonumber(ARGV[1]) - 1)
+local freed = 0
+for _, key in ipairs(keys) do
+    freed = freed + tonumber(redis.call('HGET', KEYS[2], key) or '0')
+    redis.call('HDEL', KEYS[2], key)
+    redis.call('ZREM', KEYS[1], key)
+    redis.call('DEL', key)
+end
+return {redis.call('DECRBY', KEYS[3], freed), #keys}
+"""
+
+
+def static_tables_digest() -> str:
+    # Results of named tables stay valid only as long as the tables do
+    return hashlib.sha256(json.dumps(static_tables, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def result_key(task: Signature, tables_digest: str) -> str:
+    digest = hashlib.sha256()
+    digest.update(task.task.encode('utf-8'))
+    digest.update(tables_digest.encode('utf-8'))
+    # Entries are stored in the result serializer, which may change between deployments
+    digest.update(celery_app.conf.result_serializer.encode('utf-8'))
+    for value in list(task.args) + sorted(task.kwargs.items()):
+        if isinstance(value, (bytes, bytearray)):
+            digest.update(b'b%d:' % len(value))
+            digest.update(value)
+        else:
+            encoded = json.dumps(value, sort_keys=True).encode('utf-8')
+            digest.update(b'j%d:' % len(encoded))
+            digest.update(encoded)
+    return KEY_PREFIX + digest.hexdigest()
+
+
+class ResultCache:
+    """Results of codec tasks keyed by a hash of the task and its arguments.
+
+    Entries live in Redis for `ttl` seconds; once they take more than
+    `max_bytes` in total the least recently used ones are evicted. Identical
+    requests arriving while one is still running share its result instead of
+    starting another task. Redis errors and unreadable entries make the cache
+    act as a miss.
+    """
+
+    def __init__(self, redis_url: str, ttl: int, max_bytes: int, max_entry: int):
+        self.redis_url = redis_url
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.max_entry = max_entry
+        self.tables_digest = static_tables_digest()
+        self._client: Optional[aioredis.Redis] = None
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._writes: Set[asyncio.Task] = set()
+        self.hits = 0
+        self.misses = 0
+        self.shared = 0
+
+    @property
+    def client(self) -> aioredis.Redis:
+        if self._client is None:
+            self._client = aioredis.from_url(self.redis_url, socket_connect_timeout=1, socket_timeout=1)
+        return self._client
+
+    async def get(self, key: str) -> Optional[Any]:
+        try:
+            entry = await self.client.hgetall(key)
+            if not entry:
+                # Expired by the TTL, its size must leave the total too
+                await self.client.eval(FORGET_SCRIPT, 4, key, INDEX_KEY, SIZES_KEY, TOTAL_KEY)
+                return None
+            await self.client.zadd(INDEX_KEY, {key: time.time()})
+            return loads(entry[b'body'], entry[b'content_type'].decode(), entry[b'encoding'].decode(),
+                         accept=prepare_accept_content(celery_app.conf.accept_content))
+        except (aioredis.RedisError, KombuError, KeyError):
+            # An entry that cannot be read back is recomputed and stored again
+            return None
+
+    async def set(self, key: str, value: Any):
+        content_type, encoding, body = dumps(value, serializer=celery_app.conf.result_serializer)
+        size = len(body)
+        if size > self.max_entry:
+            return
+        try:
+            total = await self.client.eval(STORE_SCRIPT, 4, key, INDEX_KEY, SIZES_KEY, TOTAL_KEY,
+                                           content_type, encoding, body, self.ttl, time.time(), size)
+            if total > self.max_bytes:
+                await self.evict(total)
+        except aioredis.RedisError:
+            pass
+
+    async def evict(self, total: int):
+        # Entries already expired by the TTL are dropped from the index on the way
+        while total > self.max_bytes:
+            total, evicted = await self.client.eval(EVICT_SCRIPT, 3, INDEX_KEY, SIZES_KEY, TOTAL_KEY, 16)
+            if not evicted:
+                break
+
+    async def run(self, task: Signature, compute: Callable[[], Awaitable[Any]]) -> Any:
+        key = result_key(task, self.tables_digest)
+        shared = self._inflight.get(key)
+        if shared is not None:
+            self.shared += 1
+            try:
+                return await asyncio.shield(shared)
+            except asyncio.CancelledError:
+                if not shared.cancelled():
+                    raise
+                self.shared -= 1
+            # The request that started the task went away, run it here instead
+
+        # Registered before the lookup, so requests arriving meanwhile wait for this one
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            result = await self.get(key) if self.ttl else None
+            if result is not None:
+                self.hits += 1
+            else:
+                self.misses += 1
+                result = await compute()
+                if self.ttl:
+                    # Stored in the background, the reply does not wait for Redis
+                    write = asyncio.get_running_loop().create_task(self.set(key, result))
+                    self._writes.add(write)
+                    write.add_done_callback(self._writes.discard)
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Retrieved here so an unshared failure is not reported as unhandled
+            future.exception()
+            raise
+        finally:
+            if self._inflight.get(key) is future:
+                self._inflight.pop(key)
+        future.set_result(result)
+        return result
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'shared': self.shared,
+            'in_flight': len(self._inflight),
+            'hit_rate': (self.hits + self.shared) / (lookups + self.shared) if lookups + self.shared else 0.0
+        }
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+result_cache = ResultCache(REDIS_URL, settings.RESULT_CACHE_TTL, settings.RESULT_CACHE_MAX_BYTES,
+                           settings.RESULT_CACHE_MAX_ENTRY)
@@ -1,91 +1,364 @@
 from fastapi import APIRouter, WebSocket, Depends, HTTPException
 from app.websocket.manager import manager
-from app.core.config import WebSocketMessage
-from app.celery.tasks import encode_data, decode_data
-from typing import Dict, Any
+from app.websocket.events import task_events
+from app.websocket.local import run_locally, runs_locally
+from app.websocket.results import result_cache
+from app.core import metrics
+from app.core.config import WebSocketMessage, settings
+from app.celery.celery_app import queue_options
+from app.celery.tasks import (
+    encode_data, decode_data, encode_byte_data, decode_byte_data, run_batch_chunk, to_wire, from_wire
+)
+from typing import Callable, Dict, Any, List, Optional, Tuple
+import asyncio
+import base64
 import json
-from celery.result import AsyncResult
+import time
+import uuid
+from celery import group
+from celery.canvas import Signature
 from starlette.websockets import WebSocketDisconnect
 
 router = APIRouter()
 
-@router.websocket("/ws/{user_id}/{task_id}")
-async def websocket_endpoint(websocket: WebSocket, user_id: str, task_id: str):
-    await manager.connect(websocket, user_id, task_id)
+def split_payload(operation: str, task_result: Any, binary: bool) -> Tuple[Dict[str, Any], Optional[bytes]]:
+    # Separates the payload from the JSON part of a task result. In binary mode
+    # the payload is returned as raw bytes to be sent in its own frame.
+    if operation == "decode":
+        if binary:
+            return {}, task_result.encode('utf-8')
+        return {"result": task_result}, None
+    if operation == "decode_bytes":
+        payload = from_wire(task_result)
+        if binary:
+            return {}, payload
+        return {"result": base64.b64encode(payload).decode('utf-8')}, None
+
+    result = dict(task_result)
+    payload = from_wire(result.pop("encoded_data"))
+    if binary:
+        return result, payload
+    result["encoded_data"] = base64.b64encode(payload).decode('utf-8')
+    return result, None
+
+def build_task(operation: str, input_data: Any, data: Dict[str, Any]) -> Signature:
+    # Picks the Celery task for a request, ValueError describes a bad request
+    output_format = data.get("format", "json")
+    table = data.get("table")
+    if not operation or not input_data:
+        raise ValueError("Invalid request format")
+
+    if operation == "encode":
+        return encode_data.s(input_data, output_format, table)
+    if operation == "encode_bytes":
+        return encode_byte_data.s(input_data, output_format)
+    if operation == "decode_bytes" and output_format in ("container", "stream"):
+        return decode_byte_data.s(input_data)
+    if operation == "decode_bytes":
+        huffman_codes = data.get("huffman_codes")
+        padding = data.get("padding")
+        if not huffman_codes or padding is None:
+            raise ValueError("Missing huffman_codes or padding for decode operation")
+        return decode_byte_data.s(input_data, huffman_codes, padding)
+    if operation == "decode" and output_format in ("container", "stream"):
+        return decode_data.s(input_data)
+    if operation == "decode" and table:
+        padding = data.get("padding")
+        if padding is None:
+            raise ValueError("Missing padding for decode operation")
+        return decode_data.s(input_data, None, padding, table)
+    if operation == "decode":
+        huffman_codes = data.get("huffman_codes")
+        padding = data.get("padding")
+        if not huffman_codes or padding is None:
+            raise ValueError("Missing huffman_codes or padding for decode operation")
+        return decode_data.s(input_data, huffman_codes, padding)
+    raise ValueError("Invalid operation")
+
+class InvalidRequest(ValueError):
+    def __init__(self, message: str, task_id: Any = None):
+        super().__init__(message)
+        self.task_id = task_id
+
+async def receive_request(websocket: WebSocket) -> Tuple[Dict[str, Any], Any]:
+    # KeyError: a binary frame where text was expected, or the other way round
     try:
         data = await websocket.receive_json()
-        operation = data.get("operation")
-        input_data = data.get("data")
-        
-        if not operation or not input_data:
-            await websocket.send_json({
-                "status": "ERROR",
-                "message": "Invalid request format"
-            })
-            return
+    except (ValueError, KeyError):
+        raise InvalidRequest("Invalid request format")
+    if not isinstance(data, dict):
+        raise InvalidRequest("Invalid request format")
+    input_data = data.get("data")
+    if data.get("binary", False):
+        # The payload follows the control message in a binary frame
+        try:
+            payload = await websocket.receive_bytes()
+            input_data = payload.decode('utf-8') if data.get("operation") == "encode" else to_wire(payload)
+        except KeyError:
+            raise InvalidRequest("Expected a binary payload frame", data.get("task_id"))
+        except UnicodeDecodeError:
+            raise InvalidRequest("Payload to encode is not valid UTF-8", data.get("task_id"))
+    return data, input_data
+
+async def send_error(user_id: str, task_id: str, message: str):
+    await manager.send_json({
+        "status": "ERROR",
+        "task_id": task_id,
+        "message": message
+    }, user_id, task_id)
+
+async def run_celery(task: Signature, options: Dict[str, Any], on_progress: Callable[[Dict[str, Any]], None]) -> Any:
+    # Wait for the completion event without blocking other connections
+    celery_task_id = str(uuid.uuid4())
+    task_events.watch(celery_task_id, on_progress)
+    try:
+        # Publishing may block on the broker, reconnects included
+        await asyncio.to_thread(
+            task.apply_async, task_id=celery_task_id, headers={"enqueued_at": time.time()}, **options)
+        return await task_events.wait(celery_task_id, settings.TASK_TIMEOUT)
+    finally:
+        task_events.forget(celery_task_id)
+
+async def run_batch(user_id: str, task_id: str, data: Dict[str, Any]):
+    """Runs many items as one Celery group and streams every result back.
+
+    Items are split into chunks of BATCH_CHUNK_SIZE, one task each, and an
+    ITEM message goes out for every item of a chunk as soon as it finishes.
+    The final COMPLETED message only carries the counts.
+    """
+    items = data.get("items")
+    if not isinstance(items, list) or not items:
+        raise ValueError("Batch requires a non-empty items list")
+    if len(items) > settings.BATCH_MAX_ITEMS:
+        raise ValueError(f"Batch is limited to {settings.BATCH_MAX_ITEMS} items")
+    if data.get("binary", False):
+        raise ValueError("Batch results are sent as JSON only")
+
+    await manager.send_message(WebSocketMessage(status="STARTED", task_id=task_id, operation="batch"),
+                               user_id, task_id)
+    failed = 0
 
+    async def send_item(index: int, operation: str, result: Dict[str, Any]):
+        await manager.send_message(WebSocketMessage(
+            status="ITEM",
+            task_id=task_id,
+            operation=operation,
+            result=dict(result, index=index)
+        ), user_id, task_id)
+
+    operations: Dict[int, str] = {}
+    sizes: Dict[int, int] = {}
+    entries: List[List[Any]] = []
+    for index, item in enumerate(items):
+        operation = item.get("operation") if isinstance(item, dict) else None
         try:
-            # Start notification
-            start_message = WebSocketMessage(
-                status="STARTED",
-                task_id=task_id,
-                operation=operation
+            # A malformed item fails only itself, like an item that fails in the worker
+            if not isinstance(item, dict):
+                raise ValueError("Batch item must be an object")
+            input_data = item.get("data")
+            if input_data is not None and not isinstance(input_data, str):
+                raise ValueError("Batch item data must be a string")
+            task = build_task(operation, input_data, item)
+        except ValueError as e:
+            failed += 1
+            await send_item(index, operation if isinstance(operation, str) else "", {"error": str(e)})
+            continue
+        operations[index] = operation
+        sizes[index] = len(input_data)
+        entries.append([index, task.task, list(task.args)])
+
+    size = settings.BATCH_CHUNK_SIZE
+    chunks = [entries[start:start + size] for start in range(0, len(entries), size)]
+    chunk_ids = [str(uuid.uuid4()) for _ in chunks]
+    for chunk_id in chunk_ids:
+        task_events.watch(chunk_id)
+    waits: List[asyncio.Task] = []
+    try:
+        if chunks:
+            batch = group(
+                run_batch_chunk.s(chunk).set(
+                    task_id=chunk_id, headers={"enqueued_at": time.time()},
+                    **queue_options("batch", sum(sizes[entry[0]] for entry in chunk)))
+                for chunk, chunk_id in zip(chunks, chunk_ids)
             )
-            await manager.send_message(start_message, user_id, task_id)
-
-            # Process the task
-            if operation == "encode":
-                task = encode_data.delay(input_data)
-            elif operation == "decode":
-                huffman_codes = data.get("huffman_codes")
-                padding = data.get("padding")
-                if not huffman_codes or padding is None:
-                    await websocket.send_json({
-                        "status": "ERROR",
-                        "message": "Missing huffman_codes or padding for decode operation"
-                    })
-                    return
-                task = decode_data.delay(input_data, huffman_codes, padding)
-            else:
-                await websocket.send_json({
-                    "status": "ERROR",
-                    "message": "Invalid operation"
-                })
-                return
+            # Publishing talks to the broker, which must not stall the event loop
+            await asyncio.to_thread(batch.apply_async)
+        waits = [asyncio.ensure_future(task_events.wait(chunk_id, settings.BATCH_TIMEOUT)) for chunk_id in chunk_ids]
+        for finished in asyncio.as_completed(waits):
+            for index, error, value in await finished:
+                if error is not None:
+                    failed += 1
+                    await send_item(index, operations[index], {"error": error})
+                else:
+                    await send_item(index, operations[index], split_payload(operations[index], value, False)[0])
+    finally:
+        for wait in waits:
+            wait.cancel()
+        for chunk_id in chunk_ids:
+            task_events.forget(chunk_id)
 
-            # Wait for the task to complete with timeout
-            result = AsyncResult(task.id)
-            task_result = result.get(timeout=30)  # 30 seconds timeout
+    await manager.send_message(WebSocketMessage(
+        status="COMPLETED",
+        task_id=task_id,
+        operation="batch",
+        result={"items": len(items), "failed": failed}
+    ), user_id, task_id)
 
-            # Send completion notification
-            complete_message = WebSocketMessage(
-                status="COMPLETED",
-                task_id=task_id,
-                operation=operation,
-                result=task_result if isinstance(task_result, dict) else {"result": task_result}
-            )
-            await manager.send_message(complete_message, user_id, task_id)
+def data_size(value: Any, text: bool) -> int:
+    # Raw bytes, plain text, or base64 text standing for bytes
+    if isinstance(value, (bytes, bytearray)) or text:
+        return len(value)
+    return len(value) * 3 // 4
 
+def record_request(operation: str, path: str, received_at: float, size_in: int, size_out: int):
+    metrics.requests_total.inc(operation=operation, status="completed")
+    metrics.request_latency.observe(time.monotonic() - received_at, operation=operation, path=path)
+    metrics.bytes_in.observe(size_in, operation=operation)
+    metrics.bytes_out.observe(size_out, operation=operation)
+    if operation.startswith("encode") and size_in:
+        metrics.compression_ratio.observe(size_out / size_in, operation=operation)
+
+async def run_request(user_id: str, task_id: str, data: Dict[str, Any], input_data: Any):
+    received_at = time.monotonic()
+    operation = data.get("operation")
+    binary = data.get("binary", False)
+    if operation == "batch":
+        try:
+            await run_batch(user_id, task_id, data)
         except TimeoutError:
-            if manager.get_connection(user_id, task_id):
-                await websocket.send_json({
-                    "status": "ERROR",
-                    "message": "Task timed out"
-                })
+            await send_error(user_id, task_id, "Task timed out")
         except Exception as e:
-            if manager.get_connection(user_id, task_id):
-                await websocket.send_json({
-                    "status": "ERROR",
-                    "message": f"Task error: {str(e)}"
-                })
+            await send_error(user_id, task_id, f"Task error: {str(e)}")
+        return
 
+    try:
+        task = build_task(operation, input_data, data)
+    except ValueError as e:
+        metrics.requests_total.inc(operation=str(operation), status="rejected")
+        await send_error(user_id, task_id, str(e))
+        return
+
+    try:
+        # Start notification
+        start_message = WebSocketMessage(
+            status="STARTED",
+            task_id=task_id,
+            operation=operation
+        )
+        await manager.send_message(start_message, user_id, task_id)
+
+        def on_progress(event: Dict[str, Any]):
+            manager.push_progress(WebSocketMessage(
+                status="PROGRESS",
+                task_id=task_id,
+                operation=operation,
+                progress=event.get("progress")
+            ), user_id, task_id)
+
+        path = "cache"
+
+        async def compute() -> Any:
+            nonlocal path
+            if runs_locally(task, len(input_data)):
+                path = "local"
+                return await asyncio.wait_for(run_locally(task), settings.TASK_TIMEOUT)
+            path = "celery"
+            return await run_celery(task, queue_options(operation, len(input_data)), on_progress)
+
+        # Identical requests are answered from the cache or share a running task
+        task_result = await result_cache.run(task, compute)
+
+        # Send completion notification
+        result_json, result_payload = split_payload(operation, task_result, binary)
+        complete_message = WebSocketMessage(
+            status="COMPLETED",
+            task_id=task_id,
+            operation=operation,
+            result=result_json
+        )
+        await manager.send_result(complete_message, result_payload, user_id, task_id)
+
+        if result_payload is not None:
+            size_out = len(result_payload)
+        else:
+            size_out = data_size(result_json.get("encoded_data", result_json.get("result", "")), operation == "decode")
+        record_request(operation, path, received_at, data_size(input_data, operation == "encode"), size_out)
+
+    except TimeoutError:
+        metrics.requests_total.inc(operation=operation, status="timeout")
+        await send_error(user_id, task_id, "Task timed out")
+    except Exception as e:
+        metrics.requests_total.inc(operation=operation, status="error")
+        await send_error(user_id, task_id, f"Task error: {str(e)}")
+
+@router.get("/ws/stats")
+async def connection_stats() -> Dict[str, int]:
+    # Outbound queue depth and drop counts of the open sockets
+    return manager.stats()
+
+@router.get("/results/stats")
+async def result_stats() -> Dict[str, Any]:
+    # Hit rate of the result cache in this process
+    return result_cache.stats()
+
+@router.websocket("/ws/{user_id}/{task_id}")
+async def websocket_endpoint(websocket: WebSocket, user_id: str, task_id: str):
+    await manager.connect(websocket, user_id, task_id)
+    try:
+        data, input_data = await receive_request(websocket)
+        await run_request(user_id, task_id, data, input_data)
     except WebSocketDisconnect:
-        manager.disconnect(user_id, task_id)
+        pass
     except Exception as e:
-        if manager.get_connection(user_id, task_id):
-            await websocket.send_json({
-                "status": "ERROR",
-                "message": str(e)
-            })
+        await send_error(user_id, task_id, str(e))
+    finally:
+        manager.disconnect(user_id, task_id)
+        await manager.release(websocket)
+
+@router.websocket("/ws/{user_id}")
+async def session_endpoint(websocket: WebSocket, user_id: str):
+    """One long-lived connection carrying many concurrent tasks.
+
+    Every request names its own task_id, and every message sent back carries
+    it, so a client can pipeline requests and match replies as they arrive.
+    """
+    await manager.accept(websocket)
+    running: Dict[str, asyncio.Task] = {}
+
+    async def run(task_id: str, data: Dict[str, Any], input_data: Any):
+        try:
+            await run_request(user_id, task_id, data, input_data)
+        finally:
+            manager.disconnect(user_id, task_id)
+            running.pop(task_id, None)
+
+    try:
+        while True:
+            try:
+                data, input_data = await receive_request(websocket)
+            except InvalidRequest as e:
+                # A bad frame fails only its own request, the session goes on
+                await manager.send_frames(websocket, {"status": "ERROR", "task_id": e.task_id, "message": str(e)})
+                continue
+            task_id = data.get("task_id")
+            if not task_id or not isinstance(task_id, str) or task_id in running:
+                await manager.send_frames(websocket, {
+                    "status": "ERROR",
+                    "task_id": task_id,
+                    "message": "Missing, invalid or duplicate task_id"
+                })
+                continue
+            manager.register(websocket, user_id, task_id)
+            if len(running) >= settings.SESSION_MAX_TASKS:
+                await send_error(user_id, task_id, "Too many tasks in flight")
+                manager.disconnect(user_id, task_id)
+                continue
+            running[task_id] = asyncio.create_task(run(task_id, data, input_data))
+    except (WebSocketDisconnect, RuntimeError):
+        # RuntimeError when the socket was closed on a slow consumer
+        pass
     finally:
-        manager.disconnect(user_id, task_id) 
\ No newline at end of file
+        # Nobody is left to read the results
+        for task in list(running.values()):
+            task.cancel()
+        await manager.release(websocket)
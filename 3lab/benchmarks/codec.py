@@ -0,0 +1,195 @@
+"""Codec benchmark: runs the Huffman codec directly, without Celery.
+
+Usage (from the 3lab directory):
+    python -m benchmarks.codec --max-size 10MB --json results.json
+    python -m benchmarks.codec --corpus /var/log/syslog --compare results.json
+"""
+import argparse
+import base64
+import json
+import platform
+import random
+import string
+import sys
+import time
+import tracemalloc
+from collections import Counter
+from typing import Callable, Dict, List, Optional
+
+from app.services.container import make_canonical, pack_container
+from app.services.huffman import (
+    ByteHuffmanDecoder,
+    HuffmanDecoder,
+    HuffmanEncoder,
+    build_codes_from_frequency,
+    byte_codes_list,
+    byte_frequency,
+)
+from app.services.tables import text_frequency as english_frequency
+
+SIZES = [1 << 10, 10 << 10, 100 << 10, 1 << 20, 10 << 20, 100 << 20]
+PHASES = ['count', 'build', 'encode', 'pack', 'base64', 'decode']
+
+
+def parse_size(value: str) -> int:
+    units = {'KB': 1 << 10, 'MB': 1 << 20, 'GB': 1 << 30}
+    value = value.upper()
+    for unit, factor in units.items():
+        if value.endswith(unit):
+            return int(float(value[:-len(unit)]) * factor)
+    return int(value)
+
+
+def weighted_text(alphabet: str, weights: List[float], size: int, seed: int) -> str:
+    rng = random.Random(seed)
+    # Sampling a pool and repeating it keeps generation fast for large sizes
+    pool = ''.join(rng.choices(alphabet, weights, k=min(size, 1 << 20)))
+    return (pool * (size // len(pool) + 1))[:size]
+
+
+def make_profiles() -> Dict[str, Callable[[int], object]]:
+    ascii_alphabet = string.printable
+    text_frequency = english_frequency()
+    cyrillic = ''.join(chr(code) for code in range(0x0410, 0x0450)) + ' .,\n'
+    return {
+        # Every printable character equally likely, close to the worst case
+        'uniform-ascii': lambda size: weighted_text(ascii_alphabet, [1] * len(ascii_alphabet), size, 1),
+        # English-like letter distribution
+        'english': lambda size: weighted_text(''.join(text_frequency), list(text_frequency.values()), size, 2),
+        # Zipf distribution over a large unicode alphabet
+        'zipf-unicode': lambda size: weighted_text(
+            cyrillic, [1 / rank for rank in range(1, len(cyrillic) + 1)], size, 3),
+        # Two symbols with a heavy skew, one bit per symbol at best
+        'low-entropy': lambda size: weighted_text('ab', [0.95, 0.05], size, 4),
+        # Random bytes through the byte-mode codec
+        'random-bytes': lambda size: random.Random(5).randbytes(size),
+    }
+
+
+def timed(timings: Dict[str, float], phase: str, func: Callable, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    timings[phase] = timings.get(phase, 0.0) + time.perf_counter() - start
+    return result
+
+
+def run_codec(data, timings: Dict[str, float]) -> int:
+    # One full round trip, timing every phase separately
+    if isinstance(data, bytes):
+        frequency = timed(timings, 'count', byte_frequency, data)
+        codes = timed(timings, 'build', lambda: make_canonical(
+            build_codes_from_frequency({value: freq for value, freq in enumerate(frequency) if freq})))
+        code_list = byte_codes_list(codes)
+        payload, padding = timed(timings, 'encode', HuffmanEncoder(code_list).encode, data)
+        decode = lambda: ByteHuffmanDecoder(code_list).decode(payload, padding)
+    else:
+        frequency = timed(timings, 'count', Counter, data)
+        codes = timed(timings, 'build', lambda: make_canonical(build_codes_from_frequency(frequency)))
+        payload, padding = timed(timings, 'encode', HuffmanEncoder(codes).encode, data)
+        decode = lambda: HuffmanDecoder(codes).decode(payload, padding)
+
+    container = timed(timings, 'pack', pack_container, codes, payload, padding)
+    timed(timings, 'base64', base64.b64encode, container)
+    # Decoding includes building the lookup table, as an uncached request would
+    decoded = timed(timings, 'decode', decode)
+    if decoded != data:
+        raise AssertionError("Round trip mismatch")
+    return len(container)
+
+
+def input_size(data) -> int:
+    return len(data) if isinstance(data, bytes) else len(data.encode('utf-8'))
+
+
+def benchmark(name: str, data, repeat: int, measure_memory: bool) -> Dict[str, object]:
+    timings: Dict[str, float] = {}
+    for _ in range(repeat):
+        encoded_size = run_codec(data, timings)
+    timings = {phase: timings[phase] / repeat for phase in PHASES}
+
+    peak = None
+    if measure_memory:
+        # Separate pass, tracemalloc slows allocations down considerably
+        tracemalloc.start()
+        run_codec(data, {})
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+    size = input_size(data)
+    encode_time = timings['count'] + timings['build'] + timings['encode'] + timings['pack']
+    return {
+        'profile': name,
+        'symbols': len(data),
+        'input_bytes': size,
+        'encoded_bytes': encoded_size,
+        'ratio': encoded_size / size if size else 0.0,
+        'encode_mb_s': size / encode_time / 1e6 if encode_time else 0.0,
+        'decode_mb_s': size / timings['decode'] / 1e6 if timings['decode'] else 0.0,
+        'phases': timings,
+        'peak_memory_bytes': peak,
+    }
+
+
+def load_corpus(path: str, size: int):
+    with open(path, 'rb') as f:
+        raw = f.read(size)
+    try:
+        return raw.decode('utf-8')
+    except UnicodeDecodeError:
+        return raw
+
+
+def print_row(result: Dict[str, object], baseline: Optional[Dict[str, object]] = None):
+    phases = ' '.join(f"{phase}={result['phases'][phase] * 1000:8.2f}ms" for phase in PHASES)
+    memory = result['peak_memory_bytes']
+    memory = f"{memory / (1 << 20):7.1f}MiB" if memory is not None else '      -'
+    line = (f"{result['profile']:<14} {result['input_bytes']:>11} {result['ratio']:6.3f} "
+            f"enc {result['encode_mb_s']:7.2f}MB/s dec {result['decode_mb_s']:7.2f}MB/s {memory} {phases}")
+    if baseline:
+        line += (f"  vs base: enc x{result['encode_mb_s'] / baseline['encode_mb_s']:.2f}"
+                 f" dec x{result['decode_mb_s'] / baseline['decode_mb_s']:.2f}")
+    print(line, flush=True)
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--max-size', default='1MB', help='Largest corpus size, e.g. 100MB (default: 1MB)')
+    parser.add_argument('--profile', action='append', help='Run only these entropy profiles')
+    parser.add_argument('--corpus', action='append', default=[], help='Real file to benchmark as well')
+    parser.add_argument('--repeat', type=int, default=3, help='Timed runs per case (default: 3)')
+    parser.add_argument('--no-memory', action='store_true', help='Skip the peak memory pass')
+    parser.add_argument('--json', dest='json_path', help='Write machine-readable results to this file')
+    parser.add_argument('--compare', help='Results file of a previous run to compare with')
+    args = parser.parse_args(argv)
+
+    max_size = parse_size(args.max_size)
+    profiles = make_profiles()
+    selected = args.profile or list(profiles)
+    baseline = {}
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = {(r['profile'], r['input_bytes']): r for r in json.load(f)['results']}
+
+    results = []
+    cases = [(name, size) for name in selected for size in SIZES if size <= max_size]
+    for name, size in cases:
+        data = profiles[name](size)
+        results.append(benchmark(name, data, args.repeat, not args.no_memory))
+        print_row(results[-1], baseline.get((name, results[-1]['input_bytes'])))
+    for path in args.corpus:
+        data = load_corpus(path, max_size)
+        results.append(benchmark(path, data, args.repeat, not args.no_memory))
+        print_row(results[-1], baseline.get((path, results[-1]['input_bytes'])))
+
+    if args.json_path:
+        with open(args.json_path, 'w') as f:
+            json.dump({
+                'python': sys.version.split()[0],
+                'platform': platform.platform(),
+                'timestamp': time.strftime("%Y-%m-%dT%H:%M:%S"),
+                'results': results
+            }, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
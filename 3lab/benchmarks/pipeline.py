@@ -0,0 +1,204 @@
+"""Pipeline benchmark: the whole service in one process, without Redis.
+
+Boots the FastAPI app under uvicorn, an in-memory Celery broker and result
+backend and real Celery workers for the small, large and block queues, then runs
+scripted workloads over WebSockets and reports throughput and latency per
+workload and operation. Workers run in threads of the same process, so the
+numbers are for comparing runs on one machine, not for sizing a deployment.
+
+Usage (from the 3lab directory):
+    python -m benchmarks.pipeline --json pipeline.json
+    python -m benchmarks.pipeline --workload small-json --compare pipeline.json --max-regression 0.2
+"""
+import os
+
+# Settings are read on import: repeated texts must not be answered from the
+# result cache, and there is no Redis for it anyway
+os.environ.setdefault('RESULT_CACHE_TTL', '0')
+
+import argparse
+import asyncio
+import json
+import platform
+import socket
+import sys
+import threading
+import time
+from contextlib import ExitStack
+from typing import Any, Dict, List, Optional, Tuple
+
+import uvicorn
+from celery.contrib.testing.worker import start_worker
+
+from app.celery import events as worker_events
+from app.celery.celery_app import celery_app
+from app.core.config import settings
+from app.websocket.events import TaskEvents, task_events
+from benchmarks.codec import make_profiles
+from client import WebSocketClient, run_bench
+from main import app
+
+# name: operations, format, symbols per text, binary frames, requests, connections, requests in flight per connection
+WORKLOADS: Dict[str, Tuple[List[str], str, int, bool, int, int, int]] = {
+    # Under the fast path threshold, coded in the API process
+    'small-json': (['encode', 'decode'], 'json', 1 << 10, False, 2000, 8, 4),
+    # Through the small queue
+    'medium-container': (['encode', 'decode'], 'container', 256 << 10, False, 200, 4, 2),
+    'medium-binary': (['encode', 'decode'], 'container', 256 << 10, True, 200, 4, 2),
+    # Through the large queue, fanned out into blocks
+    'large-stream': (['encode', 'decode'], 'stream', 6 << 20, True, 12, 2, 1),
+}
+TEXTS_PER_WORKLOAD = 4
+
+
+class LocalChannel:
+    """Stands in for the Redis client workers publish task events with.
+
+    Events go straight to the listener of the API process, as they would
+    through a Redis channel.
+    """
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, events: TaskEvents):
+        self.loop = loop
+        self.events = events
+
+    def publish(self, channel: str, message: str):
+        self.loop.call_soon_threadsafe(self.events.dispatch, json.loads(message))
+
+
+class Stack:
+    """The API server and workers of one benchmark run."""
+
+    def __init__(self, concurrency: int):
+        self.concurrency = concurrency
+        self.exit_stack = ExitStack()
+        self.loop = asyncio.new_event_loop()
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.server: Optional[uvicorn.Server] = None
+        self.thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.sock.getsockname()
+        return f"ws://{host}:{port}"
+
+    def __enter__(self) -> 'Stack':
+        # The memory transport polls its queues, Redis hands messages over as they come
+        celery_app.conf.update(
+            broker_url='memory://', result_backend='cache+memory://',
+            broker_transport_options={**celery_app.conf.broker_transport_options, 'polling_interval': 0.001})
+        worker_events._client = LocalChannel(self.loop, task_events)
+        for queue in (settings.SMALL_QUEUE, settings.LARGE_QUEUE, settings.BLOCK_QUEUE):
+            self.exit_stack.enter_context(start_worker(
+                celery_app, concurrency=self.concurrency, pool='threads', perform_ping_check=False,
+                queues=[queue]))
+
+        self.sock.bind(('127.0.0.1', 0))
+        self.server = uvicorn.Server(uvicorn.Config(app, log_level='warning', ws_max_size=64 << 20))
+        self.thread = threading.Thread(
+            target=self.loop.run_until_complete, args=(self.server.serve(sockets=[self.sock]),), daemon=True)
+        self.thread.start()
+        while not self.server.started:
+            if not self.thread.is_alive():
+                raise RuntimeError("Server failed to start")
+            time.sleep(0.01)
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.server is not None:
+            self.server.should_exit = True
+            self.thread.join()
+        self.exit_stack.close()
+        worker_events._client = None
+
+
+def workload_texts(size: int) -> List[str]:
+    text = make_profiles()['english'](size)
+    # Rotations of one text, so consecutive requests carry different data
+    step = max(1, size // TEXTS_PER_WORKLOAD)
+    return [text[shift:] + text[:shift] for shift in range(0, size, step)][:TEXTS_PER_WORKLOAD]
+
+
+def run_workload(stack: Stack, name: str, requests: Optional[int]) -> List[Dict[str, Any]]:
+    operations, output_format, size, binary, total, connections, in_flight = WORKLOADS[name]
+    client = WebSocketClient('bench', stack.url, binary=binary)
+    report = asyncio.run(run_bench(client, workload_texts(size), operations, connections, in_flight, 0,
+                                   requests or total, output_format))
+    return [dict(row, workload=name, operation=operation, elapsed=report['elapsed'])
+            for operation, row in report['operations'].items()]
+
+
+def compare(result: Dict[str, Any], baseline: Dict[str, Any]) -> Tuple[float, float]:
+    # Throughput and p95 latency relative to the baseline run
+    throughput = result['throughput'] / baseline['throughput'] if baseline['throughput'] else 0.0
+    p95 = result['p95'] / baseline['p95'] if baseline['p95'] else 0.0
+    return throughput, p95
+
+
+def print_row(result: Dict[str, Any], baseline: Optional[Dict[str, Any]] = None):
+    line = (f"{result['workload']:<18} {result['operation']:<7} {result['requests']:>6} err {result['errors']:<3}"
+            f" {result['throughput']:8.1f} req/s {result['input_mb_s']:7.2f}MB/s"
+            + ''.join(f" {key}={result[key] * 1000:8.2f}ms" for key in ('p50', 'p95', 'p99')))
+    if baseline:
+        throughput, p95 = compare(result, baseline)
+        line += f"  vs base: req/s x{throughput:.2f} p95 x{p95:.2f}"
+    print(line, flush=True)
+
+
+def regressions(results: List[Dict[str, Any]], baseline: Dict[Tuple[str, str], Dict[str, Any]],
+                limit: float) -> List[str]:
+    found = []
+    for result in results:
+        base = baseline.get((result['workload'], result['operation']))
+        if not base:
+            continue
+        throughput, p95 = compare(result, base)
+        if throughput < 1 - limit or p95 > 1 + limit or result['errors'] > base['errors']:
+            found.append(f"{result['workload']} {result['operation']}: req/s x{throughput:.2f}, p95 x{p95:.2f}, "
+                         f"{result['errors']} errors")
+    return found
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workload', action='append', choices=list(WORKLOADS), help='Run only these workloads')
+    parser.add_argument('--requests', type=int, help='Requests per workload instead of its own count')
+    parser.add_argument('--concurrency', type=int, default=4, help='Worker threads per queue (default: 4)')
+    parser.add_argument('--json', dest='json_path', help='Write machine-readable results to this file')
+    parser.add_argument('--compare', help='Results file of a previous run to compare with')
+    parser.add_argument('--max-regression', type=float,
+                        help='Exit with status 1 when req/s falls or p95 grows by more than this fraction '
+                             'against --compare')
+    args = parser.parse_args(argv)
+
+    baseline = {}
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = {(r['workload'], r['operation']): r for r in json.load(f)['results']}
+
+    results = []
+    with Stack(args.concurrency) as stack:
+        for name in args.workload or list(WORKLOADS):
+            for result in run_workload(stack, name, args.requests):
+                results.append(result)
+                print_row(result, baseline.get((name, result['operation'])))
+
+    if args.json_path:
+        with open(args.json_path, 'w') as f:
+            json.dump({
+                'python': sys.version.split()[0],
+                'platform': platform.platform(),
+                'timestamp': time.strftime("%Y-%m-%dT%H:%M:%S"),
+                'results': results
+            }, f, indent=2)
+
+    if args.max_regression is not None and baseline:
+        found = regressions(results, baseline, args.max_regression)
+        for line in found:
+            print(f"Regression: {line}", file=sys.stderr)
+        if found:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
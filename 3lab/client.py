@@ -3,24 +3,37 @@ import websockets
 import json
 import click
 import uuid
-from typing import Dict, Any
+import os
+import math
+import mmap
+from collections import deque
+import base64
+from typing import BinaryIO, Callable, Deque, Dict, Any, Iterator, List, Optional, Tuple, Union
 from websocket import create_connection, WebSocketException
 import sys
 from tqdm import tqdm
 import time
+from app.services.streaming import DEFAULT_BLOCK_SIZE, encode_file, decode_file, iter_containers
+from app.services.parallel import parallel_encode_file, parallel_decode_file
 
 class WebSocketClient:
-    def __init__(self, user_id: str, base_url: str = "ws://localhost:8000"):
+    def __init__(self, user_id: str, base_url: str = "ws://localhost:8000", binary: bool = False,
+                 session: bool = False):
         self.user_id = user_id
         self.base_url = base_url
+        # Payloads travel as raw binary frames instead of base64 inside JSON
+        self.binary = binary
+        # One long-lived connection carries every task instead of one per task
+        self.session = session
+        self.session_ws = None
         self.active_tasks: Dict[str, Any] = {}
         self.progress_bars: Dict[str, tqdm] = {}
 
-    def create_connection(self, task_id: str, max_retries: int = 3) -> str:
-        """Create a new WebSocket connection for a task with retry logic"""
+    def create_connection(self, task_id: Optional[str] = None, max_retries: int = 3) -> str:
+        """Create a new WebSocket connection for a task, or a session one, with retry logic"""
         for attempt in range(max_retries):
             try:
-                url = f"{self.base_url}/ws/{self.user_id}/{task_id}"
+                url = f"{self.base_url}/ws/{self.user_id}/{task_id}" if task_id else f"{self.base_url}/ws/{self.user_id}"
                 ws = create_connection(url, timeout=30)
                 return ws
             except Exception as e:
@@ -28,29 +41,64 @@ class WebSocketClient:
                     raise Exception(f"Failed to connect after {max_retries} attempts: {str(e)}")
                 time.sleep(1)
 
-    def encode_data(self, data: str) -> Dict[str, Any]:
-        """Encode data using Huffman coding"""
+    def open_session(self):
+        if self.session_ws is None:
+            self.session_ws = self.create_connection()
+        return self.session_ws
+
+    def close(self):
+        if self.session_ws is not None:
+            try:
+                self.session_ws.close()
+            except:
+                pass
+            self.session_ws = None
+
+    def request_frames(self, task_id: str, request: Dict[str, Any],
+                       payload: Union[str, bytes]) -> List[Union[str, bytes]]:
+        # The payload goes in its own frame in binary mode
+        request = dict(request, task_id=task_id, binary=self.binary)
+        if self.binary:
+            return [json.dumps(request), payload if isinstance(payload, bytes) else payload.encode('utf-8')]
+        request["data"] = payload
+        return [json.dumps(request)]
+
+    def send_request(self, ws, task_id: str, request: Dict[str, Any], payload: Union[str, bytes]):
+        for frame in self.request_frames(task_id, request, payload):
+            if isinstance(frame, bytes):
+                ws.send_binary(frame)
+            else:
+                ws.send(frame)
+
+    async def open_async(self) -> 'AsyncConnection':
+        """Open a session connection for the async mode"""
+        ws = await websockets.connect(f"{self.base_url}/ws/{self.user_id}", max_size=None)
+        return AsyncConnection(self, ws)
+
+    def run_task(self, request: Dict[str, Any], payload: Union[str, bytes],
+                 description: str) -> Optional[Tuple[Dict[str, Any], Optional[bytes]]]:
+        """Run one operation on a fresh connection, or on the session one.
+
+        Returns the JSON result and, in binary mode, the payload frame that
+        follows it, or None when the task failed.
+        """
         task_id = str(uuid.uuid4())
         ws = None
         try:
-            ws = self.create_connection(task_id)
-
-            # Send encode request
-            request = {
-                "operation": "encode",
-                "data": data
-            }
-            ws.send(json.dumps(request))
+            ws = self.open_session() if self.session else self.create_connection(task_id)
+            self.send_request(ws, task_id, request, payload)
 
             # Process responses
             while True:
                 try:
                     response = json.loads(ws.recv())
                     status = response.get("status")
+                    if self.session and response.get("task_id") != task_id:
+                        continue
 
                     if status == "STARTED":
-                        print(f"\nStarting encoding task {task_id}")
-                        self.progress_bars[task_id] = tqdm(total=100, desc="Encoding")
+                        print(f"\nStarting {description.lower()} task {task_id}")
+                        self.progress_bars[task_id] = tqdm(total=100, desc=description)
                     
                     elif status == "PROGRESS":
                         progress = response.get("progress", 0)
@@ -59,123 +107,684 @@ class WebSocketClient:
                     
                     elif status == "COMPLETED":
                         if task_id in self.progress_bars:
+                            self.progress_bars[task_id].update(100 - self.progress_bars[task_id].n)
                             self.progress_bars[task_id].close()
-                        return response.get("result", {})
+                        result = response.get("result", {})
+                        return result, ws.recv() if self.binary else None
                     
                     elif status == "ERROR":
                         print(f"Error: {response.get('message')}")
-                        return {}
+                        return None
 
                 except WebSocketException:
                     print("Connection closed unexpectedly")
-                    return {}
+                    if self.session:
+                        self.close()
+                    return None
 
         except Exception as e:
             print(f"Error: {str(e)}")
-            return {}
+            return None
         finally:
-            if ws:
+            if ws and not self.session:
                 try:
                     ws.close()
                 except:
                     pass
 
-    def decode_data(self, encoded_data: str, huffman_codes: Dict[str, str], padding: int) -> str:
-        """Decode data using Huffman coding"""
+    def pipeline(self, requests: List[Tuple[Dict[str, Any], Union[str, bytes]]],
+                 window: int = 64) -> List[Optional[Tuple[Dict[str, Any], Optional[bytes]]]]:
+        """Run many operations over the session connection concurrently.
+
+        Up to `window` requests are in flight at once. Results come back in
+        request order, None for the failed ones.
+        """
+        ws = self.open_session()
+        results: List[Optional[Tuple[Dict[str, Any], Optional[bytes]]]] = [None] * len(requests)
+        indexes: Dict[str, int] = {}
+        submitted = 0
+        with tqdm(total=len(requests), desc="Tasks") as bar:
+            while submitted < len(requests) or indexes:
+                while submitted < len(requests) and len(indexes) < window:
+                    task_id = str(uuid.uuid4())
+                    indexes[task_id] = submitted
+                    self.send_request(ws, task_id, *requests[submitted])
+                    submitted += 1
+
+                response = json.loads(ws.recv())
+                status = response.get("status")
+                if status not in ("COMPLETED", "ERROR") or response.get("task_id") not in indexes:
+                    continue
+                index = indexes.pop(response["task_id"])
+                if status == "COMPLETED":
+                    # The payload frame directly follows its message
+                    results[index] = response.get("result", {}), ws.recv() if self.binary else None
+                else:
+                    print(f"Error: {response.get('message')}")
+                bar.update(1)
+        return results
+
+    def run_batch(self, items: List[Dict[str, Any]],
+                  on_item: Callable[[Dict[str, Any]], None]) -> Optional[Dict[str, Any]]:
+        """Submit items as one batch request.
+
+        `on_item` is called with every item result as soon as it arrives.
+        Returns the batch summary, or None when the request failed.
+        """
         task_id = str(uuid.uuid4())
         ws = None
         try:
-            ws = self.create_connection(task_id)
-
-            # Send decode request
-            request = {
-                "operation": "decode",
-                "data": encoded_data,
-                "huffman_codes": huffman_codes,
-                "padding": padding
-            }
-            ws.send(json.dumps(request))
-
-            # Process responses
-            while True:
-                try:
+            ws = self.open_session() if self.session else self.create_connection(task_id)
+            ws.send(json.dumps({"operation": "batch", "items": items, "task_id": task_id}))
+            with tqdm(total=len(items), desc="Batch") as bar:
+                while True:
                     response = json.loads(ws.recv())
                     status = response.get("status")
-
-                    if status == "STARTED":
-                        print(f"\nStarting decoding task {task_id}")
-                        self.progress_bars[task_id] = tqdm(total=100, desc="Decoding")
-                    
-                    elif status == "PROGRESS":
-                        progress = response.get("progress", 0)
-                        if task_id in self.progress_bars:
-                            self.progress_bars[task_id].update(progress - self.progress_bars[task_id].n)
-                    
+                    if response.get("task_id") != task_id:
+                        continue
+                    if status == "ITEM":
+                        on_item(response.get("result", {}))
+                        bar.update(1)
                     elif status == "COMPLETED":
-                        if task_id in self.progress_bars:
-                            self.progress_bars[task_id].close()
-                        return response.get("result", {}).get("result", "")
-                    
+                        return response.get("result", {})
                     elif status == "ERROR":
                         print(f"Error: {response.get('message')}")
-                        return ""
-
-                except WebSocketException:
-                    print("Connection closed unexpectedly")
-                    return ""
-
+                        return None
         except Exception as e:
             print(f"Error: {str(e)}")
-            return ""
+            return None
         finally:
-            if ws:
+            if ws and not self.session:
                 try:
                     ws.close()
                 except:
                     pass
 
+    def wire_payload(self, payload: Union[str, bytes]) -> Union[str, bytes]:
+        # Encoded payloads are raw bytes in binary mode and base64 text otherwise
+        if self.binary and isinstance(payload, str):
+            return base64.b64decode(payload)
+        if not self.binary and isinstance(payload, bytes):
+            return base64.b64encode(payload).decode('utf-8')
+        return payload
+
+    def encode_data(self, data: str, output_format: str = "json", table: str = None) -> Dict[str, Any]:
+        """Encode data using Huffman coding"""
+        request = {"operation": "encode", "format": output_format, "table": table}
+        response = self.run_task(request, data, "Encoding")
+        if response is None:
+            return {}
+        result, payload = response
+        if payload is not None:
+            result["encoded_data"] = payload
+        return result
+
+    def decode_data(self, encoded_data: Union[str, bytes], huffman_codes: Dict[str, str] = None, padding: int = None,
+                    output_format: str = "json", table: str = None) -> str:
+        """Decode data using Huffman coding"""
+        request = {
+            "operation": "decode",
+            "huffman_codes": huffman_codes,
+            "padding": padding,
+            "format": output_format,
+            "table": table
+        }
+        response = self.run_task(request, self.wire_payload(encoded_data), "Decoding")
+        if response is None:
+            return ""
+        result, payload = response
+        if payload is not None:
+            return payload.decode('utf-8')
+        return result.get("result", "")
+
+    def encode_bytes(self, data: bytes, output_format: str = "json") -> Dict[str, Any]:
+        """Encode raw bytes using byte-mode Huffman coding"""
+        request = {"operation": "encode_bytes", "format": output_format}
+        response = self.run_task(request, self.wire_payload(data), "Encoding")
+        if response is None:
+            return {}
+        result, payload = response
+        result["encoded_data"] = payload if payload is not None else base64.b64decode(result["encoded_data"])
+        return result
+
+    def decode_bytes(self, encoded_data: bytes, huffman_codes: List[Optional[str]] = None, padding: int = None,
+                     output_format: str = "json") -> bytes:
+        """Decode data produced by byte-mode Huffman coding"""
+        request = {
+            "operation": "decode_bytes",
+            "huffman_codes": huffman_codes,
+            "padding": padding,
+            "format": output_format
+        }
+        response = self.run_task(request, self.wire_payload(encoded_data), "Decoding")
+        if response is None:
+            return b""
+        result, payload = response
+        return payload if payload is not None else base64.b64decode(result.get("result", ""))
+
+class AsyncConnection:
+    """Session connection with any number of requests in flight.
+
+    A reader task matches replies to requests by task id, so callers simply
+    await `request` concurrently.
+    """
+
+    def __init__(self, client: WebSocketClient, ws):
+        self.client = client
+        self.ws = ws
+        self.pending: Dict[str, asyncio.Future] = {}
+        self.reader = asyncio.ensure_future(self.read())
+
+    async def request(self, request: Dict[str, Any],
+                      payload: Union[str, bytes]) -> Tuple[Dict[str, Any], Optional[bytes]]:
+        """Run one operation, returns the JSON result and the binary mode payload.
+
+        Raises RuntimeError when the server reports an error and
+        ConnectionError when the connection is lost.
+        """
+        task_id = str(uuid.uuid4())
+        future = asyncio.get_running_loop().create_future()
+        self.pending[task_id] = future
+        try:
+            for frame in self.client.request_frames(task_id, request, payload):
+                await self.ws.send(frame)
+            return await future
+        finally:
+            self.pending.pop(task_id, None)
+
+    async def read(self):
+        completed: Optional[Tuple[asyncio.Future, Dict[str, Any]]] = None
+        try:
+            async for message in self.ws:
+                if isinstance(message, bytes):
+                    # The payload frame directly follows its message
+                    if completed is not None:
+                        future, result = completed
+                        if not future.done():
+                            future.set_result((result, message))
+                        completed = None
+                    continue
+                response = json.loads(message)
+                future = self.pending.get(response.get("task_id"))
+                status = response.get("status")
+                if future is None or future.done():
+                    continue
+                if status == "COMPLETED":
+                    if self.client.binary:
+                        completed = future, response.get("result", {})
+                    else:
+                        future.set_result((response.get("result", {}), None))
+                elif status == "ERROR":
+                    future.set_exception(RuntimeError(response.get("message")))
+        except websockets.ConnectionClosed:
+            pass
+        finally:
+            for future in self.pending.values():
+                if not future.done():
+                    future.set_exception(ConnectionError("Connection closed"))
+
+    async def close(self):
+        await self.ws.close()
+        await self.reader
+
 @click.group()
 def cli():
     """Console client for WebSocket-based Huffman coding service"""
     pass
 
+FORMAT_CHOICE = click.Choice(['json', 'container', 'stream'])
+
+def display_payload(payload: Union[str, bytes]) -> str:
+    # Binary mode returns raw bytes, show them the same way as JSON mode does
+    if isinstance(payload, bytes):
+        return base64.b64encode(payload).decode('utf-8')
+    return payload
+
 @cli.command()
 @click.option('--user-id', prompt='Enter your user ID', help='Your user ID')
 @click.option('--data', prompt='Enter data to encode', help='Data to encode')
-def encode(user_id: str, data: str):
+@click.option('--format', 'output_format', type=FORMAT_CHOICE, default='json',
+              help='json: codes table in the response, container: canonical codes packed with the payload, '
+                   'stream: one container per block')
+@click.option('--table', help='Name of a static table on the server to encode with')
+@click.option('--binary', is_flag=True, help='Send payloads in binary WebSocket frames')
+def encode(user_id: str, data: str, output_format: str, table: str, binary: bool):
     """Encode data using Huffman coding"""
-    client = WebSocketClient(user_id)
-    result = client.encode_data(data)
+    client = WebSocketClient(user_id, binary=binary)
+    result = client.encode_data(data, output_format, table)
     if result:
         print("\nEncoding result:")
-        print(f"Encoded data: {result['encoded_data']}")
-        print(f"Huffman codes: {json.dumps(result['huffman_codes'], indent=2)}")
-        print(f"Padding: {result['padding']}")
+        print(f"Encoded data: {display_payload(result['encoded_data'])}")
+        if 'huffman_codes' in result:
+            print(f"Huffman codes: {json.dumps(result['huffman_codes'], indent=2)}")
+        if 'table' in result:
+            print(f"Table: {result['table']}")
+        if 'padding' in result:
+            print(f"Padding: {result['padding']}")
 
 @cli.command()
 @click.option('--user-id', prompt='Enter your user ID', help='Your user ID')
 @click.option('--encoded-data', prompt='Enter encoded data', help='Encoded data to decode')
-@click.option('--huffman-codes', prompt='Enter Huffman codes (as JSON)', help='Huffman codes as JSON string')
-@click.option('--padding', prompt='Enter padding', type=int, help='Padding used in encoding')
-def decode(user_id: str, encoded_data: str, huffman_codes: str, padding: int):
+@click.option('--huffman-codes', help='Huffman codes as JSON string')
+@click.option('--padding', type=int, help='Padding used in encoding')
+@click.option('--format', 'output_format', type=FORMAT_CHOICE, default='json',
+              help='Format the data was encoded with')
+@click.option('--table', help='Name of the static table the data was encoded with')
+@click.option('--binary', is_flag=True, help='Send payloads in binary WebSocket frames')
+def decode(user_id: str, encoded_data: str, huffman_codes: str, padding: int, output_format: str, table: str,
+           binary: bool):
     """Decode data using Huffman coding"""
-    try:
-        huffman_dict = json.loads(huffman_codes)
-    except json.JSONDecodeError:
-        print("Error: Invalid Huffman codes JSON format")
-        return
+    huffman_dict = None
+    if output_format == 'json' and table:
+        if padding is None:
+            padding = click.prompt('Enter padding', type=int)
+    elif output_format == 'json':
+        # The container carries its own table, plain results need it from the user
+        if huffman_codes is None:
+            huffman_codes = click.prompt('Enter Huffman codes (as JSON)')
+        if padding is None:
+            padding = click.prompt('Enter padding', type=int)
+        try:
+            huffman_dict = json.loads(huffman_codes)
+        except json.JSONDecodeError:
+            print("Error: Invalid Huffman codes JSON format")
+            return
 
-    client = WebSocketClient(user_id)
-    result = client.decode_data(encoded_data, huffman_dict, padding)
+    client = WebSocketClient(user_id, binary=binary)
+    result = client.decode_data(encoded_data, huffman_dict, padding, output_format, table)
     if result:
         print("\nDecoded result:")
         print(result)
 
+@cli.command('encode-bytes')
+@click.option('--user-id', prompt='Enter your user ID', help='Your user ID')
+@click.argument('src', type=click.Path(exists=True, dir_okay=False))
+@click.argument('dst', type=click.Path(dir_okay=False))
+@click.option('--format', 'output_format', type=FORMAT_CHOICE, default='container',
+              help='json writes the payload with its 256-entry code table as JSON, '
+                   'container and stream write the binary result')
+@click.option('--binary', is_flag=True, help='Send payloads in binary WebSocket frames')
+def encode_bytes(user_id: str, src: str, dst: str, output_format: str, binary: bool):
+    """Encode an arbitrary binary file on the server"""
+    with open(src, 'rb') as f:
+        data = f.read()
+    client = WebSocketClient(user_id, binary=binary)
+    result = client.encode_bytes(data, output_format)
+    if not result:
+        return
+    if output_format == 'json':
+        result["encoded_data"] = display_payload(result["encoded_data"])
+        with open(dst, 'w') as f:
+            json.dump(result, f)
+    else:
+        with open(dst, 'wb') as f:
+            f.write(result["encoded_data"])
+    print(f"Encoded {len(data)} bytes into {dst}")
+
+@cli.command('decode-bytes')
+@click.option('--user-id', prompt='Enter your user ID', help='Your user ID')
+@click.argument('src', type=click.Path(exists=True, dir_okay=False))
+@click.argument('dst', type=click.Path(dir_okay=False))
+@click.option('--format', 'output_format', type=FORMAT_CHOICE, default='container',
+              help='Format the file was encoded with')
+@click.option('--binary', is_flag=True, help='Send payloads in binary WebSocket frames')
+def decode_bytes(user_id: str, src: str, dst: str, output_format: str, binary: bool):
+    """Decode a file produced by encode-bytes"""
+    client = WebSocketClient(user_id, binary=binary)
+    if output_format == 'json':
+        with open(src) as f:
+            encoded = json.load(f)
+        result = client.decode_bytes(encoded["encoded_data"], encoded["huffman_codes"], encoded["padding"])
+    else:
+        with open(src, 'rb') as f:
+            result = client.decode_bytes(f.read(), output_format=output_format)
+    with open(dst, 'wb') as f:
+        f.write(result)
+    print(f"Decoded {len(result)} bytes into {dst}")
+
+def batch_items(src: str, operation: str, output_format: str) -> Tuple[List[Dict[str, Any]], List[str]]:
+    # A directory gives one item per file, a JSONL file one item per line
+    if os.path.isdir(src):
+        sources = sorted(name for name in os.listdir(src) if os.path.isfile(os.path.join(src, name)))
+        items = []
+        for name in sources:
+            if operation == 'encode':
+                with open(os.path.join(src, name), encoding='utf-8', newline='') as f:
+                    data = f.read()
+            else:
+                with open(os.path.join(src, name), 'rb') as f:
+                    data = base64.b64encode(f.read()).decode('utf-8')
+            items.append({"operation": operation, "data": data, "format": output_format})
+        return items, sources
+
+    items = []
+    with open(src, encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                items.append(json.loads(line))
+    return items, [f"{src}:{number}" for number in range(1, len(items) + 1)]
+
+@cli.command()
+@click.option('--user-id', prompt='Enter your user ID', help='Your user ID')
+@click.argument('src', type=click.Path(exists=True))
+@click.option('--operation', type=click.Choice(['encode', 'decode']), default='encode',
+              help='Operation applied to the files of a directory')
+@click.option('--format', 'output_format', type=FORMAT_CHOICE, default='container',
+              help='Format of the files of a directory, decoding needs container or stream')
+@click.option('--output', type=click.Path(dir_okay=False), help='JSONL file for the results, stdout by default')
+def batch(user_id: str, src: str, operation: str, output_format: str, output: str):
+    """Encode or decode many items in one request.
+
+    SRC is either a directory, every file of which becomes one item, or a JSONL
+    file with one request per line, e.g. {"operation": "encode", "data": "..."}.
+    Results are written as JSONL in the order they finish.
+    """
+    if os.path.isdir(src) and operation == 'decode' and output_format == 'json':
+        print("Error: decoding a directory needs --format container or stream")
+        return
+    items, sources = batch_items(src, operation, output_format)
+    out = open(output, 'w', encoding='utf-8') if output else sys.stdout
+
+    def write_item(result: Dict[str, Any]):
+        out.write(json.dumps(dict(result, source=sources[result["index"]])) + "\n")
+        out.flush()
+
+    try:
+        client = WebSocketClient(user_id)
+        summary = client.run_batch(items, write_item)
+    finally:
+        if output:
+            out.close()
+    if summary:
+        print(f"Processed {summary['items']} items, {summary['failed']} failed", file=sys.stderr)
+
+def load_corpus(src: str) -> List[str]:
+    # A directory gives one text per file, a file is a single text
+    if os.path.isdir(src):
+        paths = sorted(os.path.join(src, name) for name in os.listdir(src)
+                       if os.path.isfile(os.path.join(src, name)))
+    else:
+        paths = [src]
+    texts = []
+    for path in paths:
+        with open(path, encoding='utf-8', newline='') as f:
+            texts.append(f.read())
+    return texts
+
+def percentile(values: List[float], fraction: float) -> float:
+    # Nearest rank of already sorted values
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, max(0, math.ceil(fraction * len(values)) - 1))]
+
+async def prepare_decode(connection: AsyncConnection, texts: List[str],
+                         output_format: str) -> List[Tuple[Dict[str, Any], Union[str, bytes]]]:
+    # Decode requests replay what the server produced for the corpus
+    requests = []
+    for text in texts:
+        result, payload = await connection.request({"operation": "encode", "format": output_format}, text)
+        request = {"operation": "decode", "format": output_format}
+        if output_format == 'json':
+            request.update(huffman_codes=result["huffman_codes"], padding=result["padding"])
+        encoded = payload if payload is not None else result["encoded_data"]
+        requests.append((request, connection.client.wire_payload(encoded)))
+    return requests
+
+async def run_bench(client: WebSocketClient, texts: List[str], operations: List[str], connections: int,
+                    in_flight: int, rate: float, total: int, output_format: str) -> Dict[str, Any]:
+    """Send `total` requests alternating between `operations` and time them.
+
+    With a target `rate` requests are due on a fixed schedule whether or not
+    earlier ones finished, and latency counts from that due time, so a server
+    falling behind shows up in the percentiles. Without it every slot sends
+    its next request as soon as the previous one completes.
+    """
+    opened = await asyncio.gather(*(client.open_async() for _ in range(connections)))
+    try:
+        workload: Dict[str, List[Tuple[Dict[str, Any], Union[str, bytes]]]] = {}
+        if 'encode' in operations:
+            workload['encode'] = [({"operation": "encode", "format": output_format}, text) for text in texts]
+        if 'decode' in operations:
+            workload['decode'] = await prepare_decode(opened[0], texts, output_format)
+        names = list(workload)
+        latencies: Dict[str, List[float]] = {name: [] for name in names}
+        errors = {name: 0 for name in names}
+        sizes = {name: 0 for name in names}
+        tickets: asyncio.Queue = asyncio.Queue()
+        slots = connections * in_flight
+
+        async def produce(start: float):
+            for number in range(total):
+                due = None
+                if rate:
+                    due = start + number / rate
+                    await asyncio.sleep(max(0.0, due - time.perf_counter()))
+                tickets.put_nowait((number, due))
+            for _ in range(slots):
+                tickets.put_nowait(None)
+
+        async def work(connection: AsyncConnection):
+            while True:
+                ticket = await tickets.get()
+                if ticket is None:
+                    return
+                number, due = ticket
+                name = names[number % len(names)]
+                request, payload = workload[name][number // len(names) % len(workload[name])]
+                sent = time.perf_counter() if due is None else due
+                try:
+                    await connection.request(request, payload)
+                except (RuntimeError, ConnectionError, websockets.ConnectionClosed):
+                    errors[name] += 1
+                    continue
+                latencies[name].append(time.perf_counter() - sent)
+                sizes[name] += len(payload)
+
+        start = time.perf_counter()
+        await asyncio.gather(produce(start), *(work(opened[slot % connections]) for slot in range(slots)))
+        elapsed = time.perf_counter() - start
+    finally:
+        await asyncio.gather(*(connection.close() for connection in opened), return_exceptions=True)
+
+    report: Dict[str, Any] = {"elapsed": elapsed, "operations": {}}
+    for name in names:
+        values = sorted(latencies[name])
+        report["operations"][name] = {
+            "requests": len(values),
+            "errors": errors[name],
+            "throughput": len(values) / elapsed,
+            "input_mb_s": sizes[name] / elapsed / 1e6,
+            "mean": sum(values) / len(values) if values else 0.0,
+            "p50": percentile(values, 0.50),
+            "p95": percentile(values, 0.95),
+            "p99": percentile(values, 0.99),
+            "max": values[-1] if values else 0.0
+        }
+    return report
+
+@cli.command()
+@click.argument('corpus', type=click.Path(exists=True))
+@click.option('--user-id', default='bench', help='User ID of the benchmark connections')
+@click.option('--url', 'base_url', default='ws://localhost:8000', help='Server address')
+@click.option('--operation', type=click.Choice(['encode', 'decode', 'both']), default='both',
+              help='Operations to measure, both alternates encode and decode requests')
+@click.option('--connections', type=int, default=8, help='Concurrent session connections')
+@click.option('--in-flight', type=int, default=4, help='Requests in flight per connection')
+@click.option('--rate', type=float, default=0, help='Target requests per second, 0 sends as fast as possible')
+@click.option('--requests', 'total', type=int, default=1000, help='Number of requests to send')
+@click.option('--format', 'output_format', type=FORMAT_CHOICE, default='container', help='Format to encode with')
+@click.option('--binary', is_flag=True, help='Send payloads in binary WebSocket frames')
+@click.option('--json', 'json_path', type=click.Path(dir_okay=False), help='Also write the report as JSON')
+def bench(corpus: str, user_id: str, base_url: str, operation: str, connections: int, in_flight: int,
+          rate: float, total: int, output_format: str, binary: bool, json_path: str):
+    """Load the server and report throughput and latency percentiles.
+
+    CORPUS is a text file or a directory of them. Repeated texts are served
+    from the result cache, start the server with RESULT_CACHE_TTL=0 to
+    measure the coding itself.
+    """
+    texts = load_corpus(corpus)
+    if not texts:
+        print("Error: the corpus is empty")
+        return
+    operations = ['encode', 'decode'] if operation == 'both' else [operation]
+    client = WebSocketClient(user_id, base_url, binary=binary)
+    report = asyncio.run(run_bench(client, texts, operations, connections, in_flight, rate, total, output_format))
+
+    print(f"{total} requests in {report['elapsed']:.2f}s over {connections} connections"
+          + (f", target {rate:g} req/s" if rate else ""))
+    print(f"{'operation':<10}{'requests':>10}{'errors':>8}{'req/s':>10}{'MB/s':>9}"
+          f"{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'max ms':>9}")
+    for name, row in report["operations"].items():
+        print(f"{name:<10}{row['requests']:>10}{row['errors']:>8}{row['throughput']:>10.1f}{row['input_mb_s']:>9.2f}"
+              + "".join(f"{row[key] * 1000:>9.1f}" for key in ('p50', 'p95', 'p99', 'max')))
+    if json_path:
+        with open(json_path, 'w') as f:
+            json.dump(report, f, indent=2)
+
+def release_pages(source: mmap.mmap, end: int):
+    # Mapped pages already sent would otherwise add up in the client's resident memory
+    end -= end % mmap.PAGESIZE
+    if end and hasattr(mmap, 'MADV_DONTNEED'):
+        source.madvise(mmap.MADV_DONTNEED, 0, end)
+
+def file_chunks(source: mmap.mmap, size: int) -> Iterator[bytes]:
+    for offset in range(0, len(source), size):
+        release_pages(source, offset)
+        yield source[offset:offset + size]
+
+def container_groups(source: BinaryIO, size: int) -> Iterator[bytes]:
+    # Whole containers, grouped until they reach `size` bytes
+    group = []
+    grouped = 0
+    for container in iter_containers(source):
+        group.append(container)
+        grouped += len(container)
+        if grouped >= size:
+            if isinstance(source, mmap.mmap):
+                release_pages(source, source.tell())
+            yield b''.join(group)
+            group = []
+            grouped = 0
+    if group:
+        yield b''.join(group)
+
+async def stream_file(client: WebSocketClient, chunks: Iterator[bytes], request: Dict[str, Any], result_key: str,
+                      dst: str, total: int, window: int) -> int:
+    """Send chunks as separate requests over one connection, appending results to `dst` in order.
+
+    At most `window` chunks are in flight, so memory is bounded by the window
+    and the chunk size rather than by the file. Returns the bytes written.
+    """
+    connection = await client.open_async()
+    pending: Deque[Tuple[int, asyncio.Future]] = deque()
+    written = 0
+    try:
+        with open(dst, 'wb') as out, tqdm(total=total, unit='B', unit_scale=True, desc="Sending") as bar:
+            async def write_oldest():
+                nonlocal written
+                size, future = pending.popleft()
+                result, payload = await future
+                data = payload if payload is not None else base64.b64decode(result[result_key])
+                out.write(data)
+                written += len(data)
+                bar.update(size)
+
+            for chunk in chunks:
+                pending.append((len(chunk), asyncio.ensure_future(
+                    connection.request(request, client.wire_payload(chunk)))))
+                if len(pending) >= window:
+                    await write_oldest()
+            while pending:
+                await write_oldest()
+    finally:
+        for _, future in pending:
+            future.cancel()
+        await connection.close()
+    return written
+
+def run_file_command(client: WebSocketClient, src: str, dst: str, request: Dict[str, Any], result_key: str,
+                     chunks: Callable[[mmap.mmap], Iterator[bytes]], window: int) -> Optional[int]:
+    # The input is memory mapped, only the chunks in flight are ever copied out of it
+    total = os.path.getsize(src)
+    try:
+        if not total:
+            return asyncio.run(stream_file(client, iter(()), request, result_key, dst, total, window))
+        with open(src, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as source:
+            return asyncio.run(stream_file(client, chunks(source), request, result_key, dst, total, window))
+    except (RuntimeError, ConnectionError, OSError, websockets.WebSocketException) as e:
+        print(f"Error: {str(e)}")
+        return None
+
+@cli.command('encode-file')
+@click.option('--user-id', prompt='Enter your user ID', help='Your user ID')
+@click.argument('src', type=click.Path(exists=True, dir_okay=False))
+@click.argument('dst', type=click.Path(dir_okay=False))
+@click.option('--chunk-size', type=int, default=DEFAULT_BLOCK_SIZE, help='Bytes sent per request')
+@click.option('--window', type=int, default=4, help='Chunks in flight at once')
+@click.option('--binary', is_flag=True, help='Send payloads in binary WebSocket frames')
+def encode_file_command(user_id: str, src: str, dst: str, chunk_size: int, window: int, binary: bool):
+    """Encode a file of any size on the server.
+
+    The file is sent in chunks and every chunk comes back as stream format
+    containers, so DST is a stream that decode-file restores byte for byte.
+    """
+    client = WebSocketClient(user_id, binary=binary)
+    written = run_file_command(
+        client, src, dst, {"operation": "encode_bytes", "format": "stream"}, "encoded_data",
+        lambda source: file_chunks(source, chunk_size), window)
+    if written is not None:
+        print(f"Encoded {os.path.getsize(src)} bytes into {written} bytes in {dst}")
+
+@cli.command('decode-file')
+@click.option('--user-id', prompt='Enter your user ID', help='Your user ID')
+@click.argument('src', type=click.Path(exists=True, dir_okay=False))
+@click.argument('dst', type=click.Path(dir_okay=False))
+@click.option('--chunk-size', type=int, default=DEFAULT_BLOCK_SIZE, help='Bytes of whole containers sent per request')
+@click.option('--window', type=int, default=4, help='Chunks in flight at once')
+@click.option('--binary', is_flag=True, help='Send payloads in binary WebSocket frames')
+def decode_file_command(user_id: str, src: str, dst: str, chunk_size: int, window: int, binary: bool):
+    """Decode a file produced by encode-file on the server"""
+    client = WebSocketClient(user_id, binary=binary)
+    written = run_file_command(
+        client, src, dst, {"operation": "decode_bytes", "format": "stream"}, "result",
+        lambda source: container_groups(source, chunk_size), window)
+    if written is not None:
+        print(f"Decoded {written} bytes into {dst}")
+
+@cli.command('compress-file')
+@click.argument('src', type=click.Path(exists=True, dir_okay=False))
+@click.argument('dst', type=click.Path(dir_okay=False))
+@click.option('--block-size', type=int, default=DEFAULT_BLOCK_SIZE, help='Symbols per block')
+@click.option('--shared-table', is_flag=True, help='Use one table built from the whole file')
+@click.option('--workers', type=int, default=1, help='Processes encoding blocks in parallel')
+def compress_file(src: str, dst: str, block_size: int, shared_table: bool, workers: int):
+    """Compress a text file locally block by block"""
+    if workers > 1:
+        written = parallel_encode_file(src, dst, block_size, shared_table, workers)
+    else:
+        written = encode_file(src, dst, block_size, shared_table)
+    print(f"Wrote {written} bytes to {dst}")
+
+@cli.command('decompress-file')
+@click.argument('src', type=click.Path(exists=True, dir_okay=False))
+@click.argument('dst', type=click.Path(dir_okay=False))
+@click.option('--workers', type=int, default=1, help='Processes decoding blocks in parallel')
+def decompress_file(src: str, dst: str, workers: int):
+    """Decompress a file produced by compress-file"""
+    if workers > 1:
+        written = parallel_decode_file(src, dst, workers)
+    else:
+        written = decode_file(src, dst)
+    print(f"Wrote {written} characters to {dst}")
+
 @cli.command()
-def interactive():
+@click.option('--binary', is_flag=True, help='Send payloads in binary WebSocket frames')
+@click.option('--session', is_flag=True, help='Keep one connection open for all commands')
+def interactive(binary: bool, session: bool):
     """Start interactive mode"""
     user_id = click.prompt('Enter your user ID')
-    client = WebSocketClient(user_id)
+    client = WebSocketClient(user_id, binary=binary, session=session)
     
     while True:
         click.echo("\nAvailable commands:")
@@ -191,7 +800,7 @@ def interactive():
                 result = client.encode_data(data)
                 if result:
                     click.echo("\nEncoding result:")
-                    click.echo(f"Encoded data: {result['encoded_data']}")
+                    click.echo(f"Encoded data: {display_payload(result['encoded_data'])}")
                     click.echo(f"Huffman codes: {json.dumps(result['huffman_codes'], indent=2)}")
                     click.echo(f"Padding: {result['padding']}")
             
@@ -211,6 +820,7 @@ def interactive():
                     click.echo(result)
             
             elif choice == 3:
+                client.close()
                 break
             
             else:
@@ -1,10 +1,30 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse
+from app.core.metrics import registry
 from app.websocket.routes import router as websocket_router
+from app.websocket.events import task_events
+from app.websocket.local import shutdown_executor
+from app.websocket.results import result_cache
 
-app = FastAPI(title="Huffman Coding WebSocket Service")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # One Redis subscription per process delivers completion of all tasks
+    task_events.start()
+    yield
+    await task_events.stop()
+    shutdown_executor()
+    await result_cache.close()
+
+app = FastAPI(title="Huffman Coding WebSocket Service", lifespan=lifespan)
 
 app.include_router(websocket_router)
 
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    # Prometheus text format, stage latencies and connection state of this process
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000) 
\ No newline at end of file
+    uvicorn.run(app, host="0.0.0.0", port=8000)
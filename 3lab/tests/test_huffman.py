@@ -0,0 +1,102 @@
+import random
+
+import pytest
+
+from app.services.container import ContainerError, decode_container, encode_container
+from app.services.huffman import (
+    ByteHuffmanDecoder,
+    HuffmanDecoder,
+    build_byte_codes,
+    build_huffman_tree,
+    huffman_decode,
+    huffman_decode_bytes,
+    huffman_encode,
+    huffman_encode_bytes,
+)
+from app.services.streaming import decode_bytes, encode_bytes
+
+rng = random.Random(0)
+
+TEXTS = [
+    '',
+    'a',
+    'aaaa',
+    'Hello, World!',
+    'Grüße, 世界! ' * 50,
+    ''.join(rng.choice('abcdefgh') for _ in range(5000)),
+    # Long codes on a skewed alphabet, beyond the width of the lookup table
+    ''.join(chr(0x4e00 + min(int(rng.expovariate(0.05)), 3000)) for _ in range(20000)),
+]
+PAYLOADS = [b'', b'\x00', bytes(range(256)), bytes(rng.randrange(256) for _ in range(20000)),
+            b'\x00' * 1000 + b'\xff']
+
+
+@pytest.mark.parametrize('text', TEXTS)
+def test_text_round_trip(text):
+    codes = build_huffman_tree(text)
+    encoded, padding = huffman_encode(text, codes)
+    assert huffman_decode(encoded, codes, padding) == text
+
+
+def test_lookup_window_fits_the_longest_code():
+    assert HuffmanDecoder({'a': '0', 'b': '10', 'c': '11'}).lookup_bits == 2
+    assert HuffmanDecoder(build_huffman_tree(TEXTS[6])).lookup_bits == 12
+
+
+@pytest.mark.parametrize('text', TEXTS)
+def test_decoder_lookup_widths(text):
+    codes = build_huffman_tree(text)
+    encoded, padding = huffman_encode(text, codes)
+    for lookup_bits in (1, 3, 8, 16):
+        assert HuffmanDecoder(codes, lookup_bits).decode(encoded, padding) == text
+
+
+def test_short_payload_skips_table():
+    text = TEXTS[6]
+    codes = build_huffman_tree(text)
+    decoder = HuffmanDecoder(codes)
+    encoded, padding = huffman_encode(text[:20], codes)
+    assert decoder.decode(encoded, padding) == text[:20]
+    assert decoder._table is None
+    encoded, padding = huffman_encode(text, codes)
+    assert decoder.decode(encoded, padding) == text
+    assert decoder._table is not None
+
+
+@pytest.mark.parametrize('data', PAYLOADS)
+def test_byte_round_trip(data):
+    codes = build_byte_codes(data)
+    encoded, padding = huffman_encode_bytes(data, codes)
+    assert huffman_decode_bytes(encoded, codes, padding) == data
+    assert ByteHuffmanDecoder(codes, 4).decode(encoded, padding) == data
+
+
+def test_progress_reaches_the_end():
+    text = TEXTS[6]
+    codes = build_huffman_tree(text)
+    encoded, padding = huffman_encode(text, codes)
+    reported = []
+    assert HuffmanDecoder(codes).decode(encoded, padding, reported.append) == text
+    assert reported[-1] == len(encoded)
+
+
+def test_missing_code_is_rejected():
+    with pytest.raises(ValueError):
+        huffman_encode('abc', {'a': '0', 'b': '1'})
+
+
+@pytest.mark.parametrize('data', TEXTS + PAYLOADS)
+def test_container_round_trip(data):
+    assert decode_container(encode_container(data)) == data
+
+
+@pytest.mark.parametrize('data', TEXTS[3:] + PAYLOADS[2:])
+def test_stream_round_trip(data):
+    assert decode_bytes(encode_bytes(data, 1000)) == data
+
+
+def test_corrupt_container_is_rejected():
+    container = bytearray(encode_container('Hello, World!'))
+    container[-5] ^= 0xff
+    with pytest.raises(ContainerError):
+        decode_container(bytes(container))
@@ -0,0 +1,76 @@
+import asyncio
+
+import pytest
+
+fakeredis = pytest.importorskip('fakeredis')
+
+from celery import signature
+
+from app.celery.celery_app import celery_app
+from app.websocket.results import INDEX_KEY, SIZES_KEY, TOTAL_KEY, ResultCache, result_key
+
+
+def make_cache(max_bytes: int = 1 << 20) -> ResultCache:
+    cache = ResultCache('redis://unused', ttl=60, max_bytes=max_bytes, max_entry=1 << 20)
+    cache._client = fakeredis.aioredis.FakeRedis()
+    return cache
+
+
+async def total(cache: ResultCache) -> int:
+    return int(await cache.client.get(TOTAL_KEY) or 0)
+
+
+def test_storing_a_key_twice_counts_it_once():
+    async def run():
+        cache = make_cache()
+        await cache.set('k', {'result': 'x' * 100})
+        first = await total(cache)
+        await cache.set('k', {'result': 'x' * 100})
+        assert await total(cache) == first
+        await cache.set('k', {'result': 'x' * 10})
+        assert await total(cache) == int(await cache.client.hget(SIZES_KEY, 'k'))
+    asyncio.run(run())
+
+
+def test_expired_key_stored_again_keeps_the_cache_usable():
+    async def run():
+        cache = make_cache(max_bytes=1000)
+        for _ in range(20):
+            await cache.set('k', {'result': 'x' * 300})
+            # What the TTL does to the entry, the bookkeeping stays behind
+            await cache.client.delete('k')
+            assert await cache.get('k') is None
+            assert await total(cache) == 0
+            assert await cache.client.zcard(INDEX_KEY) == 0
+        await cache.set('other', {'result': 'y' * 300})
+        assert await cache.get('other') == {'result': 'y' * 300}
+    asyncio.run(run())
+
+
+def test_eviction_frees_the_oldest_entries():
+    async def run():
+        cache = make_cache(max_bytes=1000)
+        for number in range(10):
+            await cache.set(f'k{number}', {'result': 'x' * 300})
+        assert await total(cache) <= 1000
+        assert await total(cache) == sum(int(size) for size in (await cache.client.hgetall(SIZES_KEY)).values())
+        assert await cache.get('k9') is not None
+        assert await cache.get('k0') is None
+    asyncio.run(run())
+
+
+def test_entry_of_another_serializer_is_a_miss(monkeypatch):
+    async def run():
+        cache = make_cache()
+        await cache.client.hset('k', mapping={'content_type': 'application/x-python-serialize',
+                                              'encoding': 'binary', 'body': b'not allowed'})
+        assert await cache.get('k') is None
+        await cache.client.hset('k', mapping={'content_type': 'application/json', 'encoding': 'utf-8',
+                                              'body': b'{broken'})
+        assert await cache.get('k') is None
+    asyncio.run(run())
+
+    task = signature('app.celery.tasks.encode_data', args=('text',))
+    json_key = result_key(task, '')
+    monkeypatch.setitem(celery_app.conf, 'result_serializer', 'msgpack')
+    assert result_key(task, '') != json_key
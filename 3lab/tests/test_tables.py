@@ -0,0 +1,69 @@
+import random
+import threading
+import time
+from collections import Counter
+
+from app.services.tables import CODE_COST_TOLERANCE, LRUCache, cached_codes, code_cost, code_cache, optimal_cost
+
+
+class YieldingKey:
+    """Key that lets other threads run whenever the cache hashes it."""
+
+    def __init__(self, value: int):
+        self.value = value
+
+    def __hash__(self):
+        time.sleep(0)
+        return hash(self.value)
+
+    def __eq__(self, other):
+        return isinstance(other, YieldingKey) and other.value == self.value
+
+
+def test_lru_cache_shared_between_threads():
+    cache = LRUCache(maxsize=1)
+    keys = [YieldingKey(value) for value in range(2)]
+    errors = []
+
+    def hammer(offset: int):
+        try:
+            for number in range(2000):
+                key = keys[(number + offset) % 2]
+                assert cache.get(key, lambda: key.value) == key.value
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=hammer, args=(offset,)) for offset in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert not errors
+    stats = cache.stats()
+    assert stats['hits'] + stats['misses'] == 4 * 2000
+    assert stats['size'] == 1
+
+
+def zipf_histogram(symbols: int, total: int) -> Counter:
+    rng = random.Random(symbols)
+    weights = [1 / rank for rank in range(1, symbols + 1)]
+    return Counter(chr(0x4e00 + index) for index in rng.choices(range(symbols), weights, k=total))
+
+
+def test_cached_codes_are_optimal_by_default():
+    code_cache.clear()
+    for frequency in (Counter('abracadabra'), Counter('a'), zipf_histogram(2000, 200000)):
+        assert code_cost(frequency, cached_codes(frequency)) == optimal_cost(frequency)
+
+
+def test_scaled_histogram_reuses_tables_within_tolerance():
+    code_cache.clear()
+    frequency = zipf_histogram(2000, 200000)
+    codes = cached_codes(frequency, resolution=1024)
+    assert code_cost(frequency, codes) <= optimal_cost(frequency) * (1 + CODE_COST_TOLERANCE)
+
+    # A histogram close to the first one may share its table
+    nudged = Counter(frequency)
+    nudged[next(iter(nudged))] += 1
+    shared = cached_codes(nudged, resolution=1024)
+    assert code_cost(nudged, shared) <= optimal_cost(nudged) * (1 + CODE_COST_TOLERANCE)